@@ -0,0 +1,245 @@
+import asyncio
+import httpx
+import logging
+import time
+from collections import Counter
+from typing import AsyncIterator
+from logging_setup import request_fields
+from metrics import Metrics
+from rate_limiter import AdaptiveRateLimiter, RequestSlots
+from token_manager import TokenManager
+from retry_policy import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RequestResult,
+    RetryPolicy,
+)
+
+
+class AsyncKeycloakClient:
+    def __init__(
+        self,
+        host: str,
+        realm: str,
+        pool_size: int = 10,
+        timeout: tuple[float, float] = (5, 30),
+        rate_limiter: AdaptiveRateLimiter | None = None,
+        page_size: int = 100,
+        prefetch: bool = True,
+        token_manager: TokenManager | None = None,
+        retry_policy: RetryPolicy | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        metrics: Metrics | None = None,
+        request_slots: RequestSlots | None = None,
+    ):
+        self.host = host
+        self.realm = realm
+        self.headers = {"Content-Type": "application/json"}
+        self.rate_limiter = (
+            rate_limiter if rate_limiter is not None else AdaptiveRateLimiter()
+        )
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.token_manager = token_manager
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = (
+            circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        )
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.request_slots = request_slots
+        self.failures: Counter[str] = Counter()
+        self.retries = 0
+        connect_timeout, read_timeout = timeout
+        self.client = httpx.AsyncClient(
+            base_url=host,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        self.__logger = logging.getLogger(__name__)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncKeycloakClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def __call(self, method: str, endpoint: str, **kwargs) -> RequestResult:
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.circuit_breaker.check()
+                response = await self.__send(method, endpoint, **kwargs)
+            except CircuitOpenError as e:
+                error = f"{type(e).__name__}: {str(e)}"
+                return self.__failed(RequestResult(method, endpoint, error=error))
+            except httpx.HTTPError as e:
+                self.circuit_breaker.failure()
+                connection_error = isinstance(
+                    e,
+                    (
+                        httpx.NetworkError,
+                        httpx.ConnectTimeout,
+                        httpx.RemoteProtocolError,
+                    ),
+                )
+                if self.retry_policy.should_retry(
+                    method, attempt, connection_error=connection_error
+                ):
+                    await self.__wait(method, endpoint, attempt)
+                    continue
+                error = f"{type(e).__name__}: {str(e)}"
+                result = RequestResult(method, endpoint, error=error, attempts=attempt)
+                return self.__failed(result)
+            status = response.status_code
+            if status >= 500:
+                self.circuit_breaker.failure()
+            else:
+                self.circuit_breaker.success()
+            if status >= 400 and self.retry_policy.should_retry(
+                method, attempt, status=status
+            ):
+                await self.__wait(method, endpoint, attempt)
+                continue
+            result = RequestResult(method, endpoint, status, response, attempts=attempt)
+            if result.ok or result.conflict or result.gone:
+                return result
+            return self.__failed(result)
+
+    async def __wait(self, method: str, endpoint: str, attempt: int) -> None:
+        delay = self.retry_policy.delay(attempt)
+        self.retries += 1
+        self.metrics.record_retry(method, endpoint, delay)
+        await asyncio.sleep(delay)
+
+    def __failed(self, result: RequestResult) -> RequestResult:
+        self.failures[str(result.status or (result.error or "").split(":")[0])] += 1
+        self.__logger.error(
+            f"Request failed: {result}",
+            extra=request_fields(
+                self.metrics.current_phase,
+                result.method,
+                result.endpoint,
+                result.status,
+            ),
+        )
+        return result
+
+    async def __send(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        response = await self.__request(method, endpoint, **kwargs)
+        if response.status_code == 401 and self.token_manager is not None:
+            self.token_manager.invalidate(response.request.headers["Authorization"])
+            response = await self.__request(method, endpoint, **kwargs)
+        return response
+
+    async def __request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        headers = self.headers
+        if self.token_manager is not None:
+            authorization = await self.token_manager.authorization_async()
+            headers = {**headers, "Authorization": authorization}
+        waited = await self.rate_limiter.acquire_async()
+        if self.request_slots is not None:
+            waited += await self.request_slots.acquire_async()
+        self.metrics.record_throttle(method, endpoint, waited)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(
+                method, endpoint, headers=headers, **kwargs
+            )
+        except httpx.HTTPError:
+            self.metrics.record(method, endpoint, None, time.perf_counter() - started)
+            raise
+        finally:
+            if self.request_slots is not None:
+                self.request_slots.release()
+        elapsed = time.perf_counter() - started
+        self.metrics.record(
+            method,
+            endpoint,
+            response.status_code,
+            elapsed,
+            len(response.request.content),
+            len(response.content),
+        )
+        self.rate_limiter.observe(
+            response.status_code, response.headers.get("Retry-After")
+        )
+        if self.__logger.isEnabledFor(logging.INFO):
+            self.__logger.info(
+                "%s url: %s   %s",
+                method,
+                endpoint,
+                response.status_code,
+                extra=request_fields(
+                    self.metrics.current_phase,
+                    method,
+                    endpoint,
+                    response.status_code,
+                    elapsed,
+                ),
+            )
+        return response
+
+    async def get(self, endpoint: str, params: dict | None = None) -> RequestResult:
+        return await self.__call("GET", endpoint, params=params)
+
+    async def post(self, endpoint: str, data: dict | list) -> RequestResult:
+        return await self.__call("POST", endpoint, json=data)
+
+    async def put(self, endpoint: str, data: dict | None = None) -> RequestResult:
+        return await self.__call("PUT", endpoint, json=data)
+
+    async def delete(
+        self, endpoint: str, id: str, data: list | None = None
+    ) -> RequestResult:
+        return await self.__call("DELETE", endpoint + id, json=data)
+
+    def failure_summary(self) -> str:
+        failures = ", ".join(f"{key}: {count}" for key, count in self.failures.items())
+        return (
+            f"Failed requests: {sum(self.failures.values())}"
+            + (f" ({failures})" if failures else "")
+            + f", retries: {self.retries}, circuit opened: {self.circuit_breaker.opened}"
+        )
+
+    async def paginate(
+        self,
+        endpoint: str,
+        params: dict | None = None,
+        page_size: int | None = None,
+        prefetch: bool | None = None,
+    ) -> AsyncIterator[dict]:
+        page_size = page_size or self.page_size
+        prefetch = self.prefetch if prefetch is None else prefetch
+        params = {"briefRepresentation": "true", **(params or {}), "max": page_size}
+
+        async def fetch(first: int) -> list:
+            result = await self.get(endpoint, params={**params, "first": first})
+            page = result.raise_for_error().data
+            if not isinstance(page, list):
+                self.__logger.error(f"Paginate: no page at first={first} of {endpoint}")
+                return []
+            return page
+
+        first = 0
+        next_page = asyncio.ensure_future(fetch(first))
+        try:
+            while True:
+                page = await next_page
+                first += page_size
+                has_more = len(page) == page_size
+                if has_more and prefetch:
+                    next_page = asyncio.ensure_future(fetch(first))
+                for item in page:
+                    yield item
+                if not has_more:
+                    return
+                if not prefetch:
+                    next_page = asyncio.ensure_future(fetch(first))
+        finally:
+            next_page.cancel()
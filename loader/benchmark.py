@@ -0,0 +1,495 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+import pandas as pd
+import requests
+from fake_keycloak import FakeKeycloakServer
+from keycloak_client import KeycloakClient, create_session
+
+
+def _report(label: str, count: int, connections: int, elapsed: float) -> None:
+    print(
+        f"{label:<15}: {count} requests, {connections} connections, "
+        f"{elapsed:.3f}s ({count / elapsed:.0f} req/s)"
+    )
+
+
+def bench_transport(count: int, pool_size: int) -> None:
+    endpoint = "/admin/realms/realm/roles"
+    with FakeKeycloakServer() as server:
+        start = time.perf_counter()
+        for _ in range(count):
+            requests.get(f"{server.url}{endpoint}").raise_for_status()
+        _report(
+            "no session", count, server.state.connections, time.perf_counter() - start
+        )
+
+        server.state.connections = 0
+        session = create_session(pool_size)
+        start = time.perf_counter()
+        for _ in range(count):
+            session.get(f"{server.url}{endpoint}").raise_for_status()
+        _report(
+            "pooled session",
+            count,
+            server.state.connections,
+            time.perf_counter() - start,
+        )
+
+        server.state.connections = 0
+        client = KeycloakClient(
+            server.url, "realm", "Bearer", "fake", session=create_session(pool_size)
+        )
+        start = time.perf_counter()
+        with client:
+            for _ in range(count):
+                client.get(endpoint)
+        _report(
+            "KeycloakClient",
+            count,
+            server.state.connections,
+            time.perf_counter() - start,
+        )
+
+
+def synthetic_rows(users: int, groups: int, roles: int):
+    role_rows = [
+        {"Role": f"role-{i}", "Role description": f"role {i}"} for i in range(roles)
+    ]
+    group_rows = [
+        {"Name": f"group-{i}", "Description": f"group {i}", "Role": f"role-{j % roles}"}
+        for i in range(groups)
+        for j in (i, i + 1)
+    ]
+    user_rows = [
+        {"Username": f"user-{i}", "Name": f"User {i}", "Group": f"group-{i % groups}"}
+        for i in range(users)
+    ]
+    return role_rows, group_rows, user_rows
+
+
+def write_synthetic_workbook(
+    path: str, users: int, groups: int = 50, roles: int = 10
+) -> None:
+    role_rows, group_rows, user_rows = synthetic_rows(users, groups, roles)
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame(role_rows).to_excel(writer, sheet_name="Roles", index=False)
+        pd.DataFrame(group_rows).to_excel(writer, sheet_name="Groups", index=False)
+        pd.DataFrame(user_rows).to_excel(writer, sheet_name="Users", index=False)
+
+
+def bench_sheets(users: int) -> None:
+    from file_reader import FileHandler
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "realm.xlsx")
+        write_synthetic_workbook(path, users)
+
+        def load_all(sidecar: bool) -> float:
+            start = time.perf_counter()
+            file_handler = FileHandler(path, sidecar=sidecar)
+            for sheet in ("Groups", "Roles", "Groups", "Users", "Roles"):
+                file_handler.sheet = sheet
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        for sheet in ("Roles", "Groups", "Roles", "Groups", "Users", "Roles"):
+            pd.read_excel(path, sheet)
+        print(f"{'read per sheet':<15}: {time.perf_counter() - start:.3f}s")
+        FileHandler.clear_cache()
+        print(f"{'cold':<15}: {load_all(sidecar=True):.3f}s")
+        print(f"{'memory cache':<15}: {load_all(sidecar=True):.3f}s")
+        FileHandler.clear_cache()
+        print(f"{'sidecar':<15}: {load_all(sidecar=True):.3f}s")
+
+
+def bench_rows(users: int, groups: int, chunk_size: int) -> None:
+    import gc
+    import tracemalloc
+    from bulk_import import build_users, chunked
+    from payloads import split_names, user_payload
+    from rows import UserRow
+    from sheet_pipeline import prepare_users
+
+    _, _, user_rows = synthetic_rows(users, groups, 1)
+    prepared = prepare_users(pd.DataFrame(user_rows))
+    del user_rows
+
+    def dict_rows() -> list[dict]:
+        columns = prepared.columns.tolist()
+        values = zip(*(prepared[column].tolist() for column in columns))
+        return [dict(zip(columns, row)) for row in values]
+
+    def eager_payloads(rows: list[dict]) -> list[dict]:
+        aggregated: dict[str, tuple[dict, set[str]]] = {}
+        for row in rows:
+            payload = {
+                **user_payload(row["Username"], row["Name"]),
+                "credentials": [
+                    {"type": "password", "value": "password", "temporary": False}
+                ],
+            }
+            _, names = aggregated.setdefault(row["Username"], (payload, set()))
+            names.update(split_names(row.get("Group", "")))
+        return [
+            {**payload, "groups": [f"/{name}" for name in sorted(names)]}
+            for payload, names in aggregated.values()
+        ]
+
+    def lazy_payloads() -> int:
+        rows = build_users(UserRow.from_frame(prepared))
+        return sum(len(chunk) for chunk in chunked(rows, chunk_size))
+
+    def measure(label: str, build) -> None:
+        gc.collect()
+        start = time.perf_counter()
+        build()
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        tracemalloc.start()
+        result = build()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        print(
+            f"{label:<26}: {elapsed:.2f}s, held {current / 2**20:.0f} MiB, "
+            f"peak {peak / 2**20:.0f} MiB"
+        )
+
+    print(f"{len(prepared)} users")
+    measure("dict rows", dict_rows)
+    measure("typed rows", lambda: list(UserRow.from_frame(prepared)))
+    measure("bulk, eager dict payloads", lambda: eager_payloads(dict_rows()))
+    measure("bulk, per-chunk payloads", lazy_payloads)
+
+
+def bench_pipeline(users: int, groups: int) -> None:
+    import json
+    import main as loader
+    from file_reader import FileHandler
+    from payloads import aggregate_users
+    from sheet_pipeline import _collect, _explode_names
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "realm.xlsx")
+        write_synthetic_workbook(path, users, groups)
+        file_handler = FileHandler(path)
+
+        start = time.perf_counter()
+        file_handler.sheet = "Groups"
+        rows = file_handler.get_fields("Name", "Description", "Role")
+        unique = [
+            json.loads(js) for js in set(json.dumps(d, sort_keys=True) for d in rows)
+        ]
+        file_handler.sheet = "Roles"
+        roles = file_handler.get_dataframe()
+        file_handler.sheet = "Groups"
+        file_handler.dataframe_merge(roles, key="Role")
+        merged = file_handler.get_fields("Name", "Description", "Role")
+        file_handler.sheet = "Users"
+        old_users = aggregate_users(
+            file_handler.get_fields("Username", "Name", "Group")
+        )
+        elapsed = time.perf_counter() - start
+        print(
+            f"{'json + merge':<15}: {len(unique) + len(merged)} group rows processed, "
+            f"{len(old_users)} users, {elapsed:.3f}s"
+        )
+
+        start = time.perf_counter()
+        new_groups = loader.get_groups(file_handler)
+        new_users = list(loader.get_users(file_handler))
+        elapsed = time.perf_counter() - start
+        print(
+            f"{'vectorized':<15}: {len(new_groups)} group rows processed, "
+            f"{len(new_users)} users, {elapsed:.3f}s"
+        )
+
+        # How prepare_users collects user -> groups, against a plain groupby.
+        exploded = _explode_names(file_handler.get_dataframe(), "Group")
+        for label, collect in (
+            ("collect", lambda: _collect(exploded["Username"], exploded["Group"])),
+            (
+                "groupby list",
+                lambda: exploded.groupby("Username", sort=False)["Group"].agg(list),
+            ),
+        ):
+            start = time.perf_counter()
+            collected = collect()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<15}: {len(collected)} users, {elapsed:.3f}s")
+
+
+def _fake_env(server: FakeKeycloakServer, **settings: str) -> dict[str, str]:
+    return {
+        **os.environ,
+        "HOST": server.url,
+        "REALM": "realm",
+        "RATE_LIMIT": "1000",
+        "RATE_LIMIT_MAX": "100000",
+        **settings,
+    }
+
+
+@contextmanager
+def _use_fake(server: FakeKeycloakServer) -> Iterator[None]:
+    # In-process handlers read Config from os.environ, so swap it only around them.
+    saved = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(_fake_env(server))
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def bench_bulk(users: int, groups: int, roles: int, chunk_size: int) -> None:
+    from manage_keycloak import KeycloakAdminHandler
+
+    role_rows, group_rows, user_rows = synthetic_rows(users, groups, roles)
+    objects = users + groups + roles
+    with FakeKeycloakServer() as server, _use_fake(server):
+        handler = KeycloakAdminHandler()
+        start = time.perf_counter()
+        handler.handle_roles(role_rows, "Role", "Role description")
+        handler.manage_groups(group_rows)
+        handler.manage_users(user_rows)
+        elapsed = time.perf_counter() - start
+        handler.close()
+        print(
+            f"{'per object':<15}: {objects} objects, {server.state.requests} requests, "
+            f"{elapsed:.3f}s ({objects / elapsed:.0f} objects/s)"
+        )
+
+    with FakeKeycloakServer() as server, _use_fake(server):
+        handler = KeycloakAdminHandler()
+        start = time.perf_counter()
+        handler.bulk_import(role_rows, group_rows, user_rows, chunk_size=chunk_size)
+        elapsed = time.perf_counter() - start
+        handler.close()
+        print(
+            f"{'partialImport':<15}: {objects} objects, {server.state.requests} requests, "
+            f"{elapsed:.3f}s ({objects / elapsed:.0f} objects/s)"
+        )
+
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+LOAD_MODES = {
+    "sequential": [],
+    "concurrent": ["-c", "{concurrency}"],
+    "bulk": ["--bulk"],
+    "plan": ["--plan"],
+    "apply": ["--apply"],
+}
+
+
+def run_loader(
+    server: FakeKeycloakServer,
+    directory: str,
+    mode: str,
+    objects: int,
+    concurrency: int = 8,
+) -> dict:
+    metrics_path = os.path.join(directory, "metrics.json")
+    env = _fake_env(server, RATE_LIMIT="100000", RETRY_BACKOFF="0.01", LOG_SAMPLE="0")
+    requests_before = server.state.requests
+    # Files rather than pipes: a chatty child would block on a full pipe buffer.
+    with (
+        tempfile.TemporaryFile() as stdout_file,
+        tempfile.TemporaryFile() as stderr_file,
+    ):
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                MAIN,
+                *(arg.format(concurrency=concurrency) for arg in LOAD_MODES[mode]),
+                "--metrics-json",
+                metrics_path,
+            ],
+            cwd=directory,
+            env=env,
+            stdout=stdout_file,
+            stderr=stderr_file,
+        )
+        # wait4 reports the child's own peak RSS rather than the largest child so far.
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        stdout_file.seek(0)
+        stdout = stdout_file.read().decode(errors="replace")
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors="replace")
+    returncode = os.waitstatus_to_exitcode(status)
+    if returncode != 0:
+        print(stderr[-2000:], file=sys.stderr)
+    requests_sent = server.state.requests - requests_before
+    # The loader's own summary counts requests that still failed after retrying.
+    failed = sum(
+        int(count) for count in re.findall(r"^Failed requests: (\d+)", stdout, re.M)
+    )
+    phases = {}
+    if os.path.exists(metrics_path):
+        with open(metrics_path, encoding="utf-8") as file:
+            phases = json.load(file)["phases"]
+        os.remove(metrics_path)
+    return {
+        "mode": mode,
+        "objects": objects,
+        "requests": requests_sent,
+        "requests_per_object": requests_sent / objects,
+        "seconds": elapsed,
+        "peak_mib": usage.ru_maxrss / 1024,
+        "failed": failed,
+        "returncode": returncode,
+        "phases": phases,
+    }
+
+
+def bench_load(
+    sizes: list[int],
+    modes: list[str],
+    groups: int,
+    roles: int,
+    latency: float,
+    jitter: float,
+    error_rate: float,
+    rerun: bool,
+    concurrency: int = 8,
+) -> list[dict]:
+    results = []
+    print(
+        f"{'users':>7} {'mode':<14}{'pass':<6}{'objects':>9}{'requests':>10}"
+        f"{'req/obj':>9}{'wall s':>9}{'peak MiB':>10}{'failed':>8}  phases"
+    )
+    for users in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            write_synthetic_workbook(
+                os.path.join(directory, "realm.xlsx"), users, groups, roles
+            )
+            objects = users + groups + roles
+            for mode in modes:
+                with FakeKeycloakServer() as server:
+                    server.state.latency = latency
+                    server.state.jitter = jitter
+                    server.state.error_rate = error_rate
+                    passes = ("cold", "warm") if rerun else ("cold",)
+                    for label in passes:
+                        result = run_loader(
+                            server, directory, mode, objects, concurrency
+                        )
+                        result.update(users=users, run=label)
+                        results.append(result)
+                        phases = ", ".join(
+                            f"{name} {seconds:.1f}s"
+                            for name, seconds in result["phases"].items()
+                        )
+                        print(
+                            f"{users:>7} {result['mode']:<14}{label:<6}{objects:>9}"
+                            f"{result['requests']:>10}"
+                            f"{result['requests_per_object']:>9.2f}"
+                            f"{result['seconds']:>9.2f}{result['peak_mib']:>10.1f}"
+                            f"{result['failed']:>8}  {phases}"
+                        )
+    return results
+
+
+def compare_baseline(results: list[dict], path: str, tolerance: float) -> bool:
+    with open(path, encoding="utf-8") as file:
+        baseline = {
+            (entry["users"], entry["mode"], entry["run"]): entry
+            for entry in json.load(file)
+        }
+    regressed = False
+    for result in results:
+        previous = baseline.get((result["users"], result["mode"], result["run"]))
+        if previous is None:
+            continue
+        for key in ("requests_per_object", "seconds", "peak_mib"):
+            if result[key] > previous[key] * (1 + tolerance):
+                regressed = True
+                print(
+                    f"Regression: {result['users']} users, {result['mode']} "
+                    f"({result['run']}) {key} {previous[key]:.2f} -> {result[key]:.2f}"
+                )
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    transport = subparsers.add_parser("transport", help="compare connection reuse")
+    transport.add_argument("-n", "--requests", type=int, default=500)
+    transport.add_argument("--pool-size", type=int, default=10)
+    bulk = subparsers.add_parser("bulk", help="compare partialImport with per-object")
+    bulk.add_argument("--users", type=int, default=2000)
+    bulk.add_argument("--groups", type=int, default=50)
+    bulk.add_argument("--roles", type=int, default=10)
+    bulk.add_argument("--chunk-size", type=int, default=500)
+    sheets = subparsers.add_parser("sheets", help="time workbook loading")
+    sheets.add_argument("--users", type=int, default=20000)
+    pipeline = subparsers.add_parser("pipeline", help="time sheet preparation")
+    pipeline.add_argument("--users", type=int, default=100000)
+    pipeline.add_argument("--groups", type=int, default=1000)
+    load = subparsers.add_parser("load", help="run main.py against the fake")
+    load.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    load.add_argument(
+        "--modes",
+        nargs="+",
+        choices=LOAD_MODES,
+        default=["sequential", "concurrent", "bulk"],
+    )
+    load.add_argument("-c", "--concurrency", type=int, default=8)
+    load.add_argument("--groups", type=int, default=50)
+    load.add_argument("--roles", type=int, default=10)
+    load.add_argument("--latency", type=float, default=0.0, help="seconds")
+    load.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    load.add_argument("--error-rate", type=float, default=0.0)
+    load.add_argument("--rerun", action="store_true", help="also time a warm run")
+    load.add_argument("--json", help="write results to this file")
+    load.add_argument("--baseline", help="compare with an earlier --json file")
+    load.add_argument("--tolerance", type=float, default=0.2)
+    rows = subparsers.add_parser("rows", help="compare dict and typed sheet rows")
+    rows.add_argument("--users", type=int, default=1000000)
+    rows.add_argument("--groups", type=int, default=1000)
+    rows.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.benchmark == "transport":
+        bench_transport(args.requests, args.pool_size)
+    elif args.benchmark == "bulk":
+        bench_bulk(args.users, args.groups, args.roles, args.chunk_size)
+    elif args.benchmark == "pipeline":
+        bench_pipeline(args.users, args.groups)
+    elif args.benchmark == "sheets":
+        bench_sheets(args.users)
+    elif args.benchmark == "rows":
+        bench_rows(args.users, args.groups, args.chunk_size)
+    elif args.benchmark == "load":
+        results = bench_load(
+            args.sizes,
+            args.modes,
+            args.groups,
+            args.roles,
+            args.latency,
+            args.jitter,
+            args.error_rate,
+            args.rerun,
+            args.concurrency,
+        )
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+        if args.baseline and compare_baseline(results, args.baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
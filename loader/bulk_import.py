@@ -0,0 +1,83 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Iterable, Iterator
+from payloads import (
+    aggregate_groups,
+    aggregate_users,
+    group_payload,
+    role_payload,
+    user_payload,
+)
+from rows import SheetRow
+
+IF_EXISTS_POLICIES = ("SKIP", "OVERWRITE", "FAIL")
+
+
+@dataclass
+class PartialImportResult:
+    added: int = 0
+    overwritten: int = 0
+    skipped: int = 0
+    failed: int = 0
+    by_type: Counter = field(default_factory=Counter)
+    imported: list[dict] = field(default_factory=list)
+
+    def add(self, response: dict) -> None:
+        self.added += response.get("added", 0)
+        self.overwritten += response.get("overwritten", 0)
+        self.skipped += response.get("skipped", 0)
+        for result in response.get("results", []):
+            self.by_type[(result.get("resourceType"), result.get("action"))] += 1
+            if result.get("id"):
+                self.imported.append(result)
+
+    def summary(self) -> str:
+        lines = [
+            f"{resource or '?':<12}{action or '?':<12}{count}"
+            for (resource, action), count in sorted(self.by_type.items())
+        ]
+        lines.append(
+            f"Added: {self.added}, overwritten: {self.overwritten}, "
+            f"skipped: {self.skipped}, failed: {self.failed}"
+        )
+        return "\n".join(lines)
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def build_roles(roles: Iterable[dict | SheetRow]) -> list[dict]:
+    unique = {
+        role["Role"]: role_payload(role["Role"], role.get("Role description", ""))
+        for role in roles
+    }
+    return list(unique.values())
+
+
+def build_groups(groups: Iterable[dict | SheetRow]) -> list[dict]:
+    return [
+        {
+            **group_payload(group["Name"], group["Description"]),
+            "realmRoles": sorted(role_names),
+        }
+        for group, role_names in aggregate_groups(groups).values()
+    ]
+
+
+def build_users(users: Iterable[dict | SheetRow]) -> Iterator[dict]:
+    # Representations are built per chunk as they are sent, not for the whole sheet.
+    for user, group_names in aggregate_users(users).values():
+        yield {
+            **user_payload(user["Username"], user["Name"]),
+            "groups": [f"/{name}" for name in sorted(group_names)],
+        }
+
+
+def import_body(section: str, chunk: list[dict], if_exists: str) -> dict:
+    if section == "roles":
+        return {"ifResourceExists": if_exists, "roles": {"realm": chunk}}
+    return {"ifResourceExists": if_exists, section: chunk}
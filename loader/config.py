@@ -1,5 +1,13 @@
 from dotenv import load_dotenv
 import os
+import requests
+from typing import Any
+from delete_engine import protected_names
+from logging.handlers import QueueListener
+from logging_setup import setup_logging
+from rate_limiter import AdaptiveRateLimiter
+from retry_policy import CircuitBreaker, RetryPolicy
+from token_manager import TokenManager, TokenServer
 
 
 class Config:
@@ -10,3 +18,92 @@ class Config:
         self.host = os.getenv("HOST", "http://127.0.0.1:8080")
         self.admin_name = os.getenv("ADMIN_NAME", "admin")
         self.admin_password = os.getenv("ADMIN_PASSWORD", "admin")
+        self.auth_realm = os.getenv("AUTH_REALM", "master")
+        self.client_id = os.getenv("CLIENT_ID", "admin-cli")
+        self.client_secret = os.getenv("CLIENT_SECRET") or None
+        self.grant_type = os.getenv("GRANT_TYPE", "password")
+        self.token_leeway = float(os.getenv("TOKEN_LEEWAY", "30"))
+        self.sheet_cache = os.getenv("SHEET_CACHE", "false").lower() == "true"
+        self.pool_size = int(os.getenv("POOL_SIZE", "10"))
+        self.connect_timeout = float(os.getenv("CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(os.getenv("READ_TIMEOUT", "30"))
+        self.page_size = int(os.getenv("PAGE_SIZE", "100"))
+        self.page_prefetch = os.getenv("PAGE_PREFETCH", "true").lower() == "true"
+        self.bulk_chunk_size = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+        self.state_dir = os.getenv("STATE_DIR", ".loader-state")
+        self.retry_attempts = int(os.getenv("RETRY_ATTEMPTS", "4"))
+        self.retry_backoff = float(os.getenv("RETRY_BACKOFF", "0.5"))
+        self.retry_max_backoff = float(os.getenv("RETRY_MAX_BACKOFF", "30"))
+        self.circuit_threshold = int(os.getenv("CIRCUIT_THRESHOLD", "10"))
+        self.circuit_reset = float(os.getenv("CIRCUIT_RESET", "30"))
+        self.rate_limit = float(os.getenv("RATE_LIMIT", "100"))
+        self.rate_limit_min = float(os.getenv("RATE_LIMIT_MIN", "1"))
+        self.rate_limit_max = float(os.getenv("RATE_LIMIT_MAX", "1000"))
+        self.log_file = os.getenv("LOG_FILE", "logs.log")
+        self.log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+        self.log_json = os.getenv("LOG_JSON", "false").lower() == "true"
+        self.log_sample = float(os.getenv("LOG_SAMPLE", "1"))
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+    def state_path(self, name: str) -> str:
+        return os.path.join(self.state_dir, f"{self.realm}-{name}")
+
+    def protected_names(self) -> dict[str, set[str]]:
+        users = []
+        # The account the loader signs in with lives in the auth realm.
+        if self.auth_realm == self.realm:
+            if self.grant_type == "password":
+                users.append(self.admin_name)
+            else:
+                users.append(f"service-account-{self.client_id}")
+        return protected_names(self.realm, users)
+
+    def create_token_manager(
+        self,
+        session: requests.Session | None = None,
+        server: TokenServer | None = None,
+    ) -> TokenManager:
+        options: dict[str, Any] = dict(
+            realm=self.auth_realm,
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+            username=self.admin_name,
+            password=self.admin_password,
+            grant_type=self.grant_type,
+            leeway=self.token_leeway,
+            timeout=self.timeout,
+        )
+        if server is not None:
+            return server.TokenManager(self.host, **options)
+        return TokenManager(self.host, session=session, **options)
+
+    def create_retry_policy(self) -> RetryPolicy:
+        return RetryPolicy(
+            attempts=self.retry_attempts,
+            backoff=self.retry_backoff,
+            max_backoff=self.retry_max_backoff,
+        )
+
+    def create_circuit_breaker(self) -> CircuitBreaker:
+        return CircuitBreaker(
+            threshold=self.circuit_threshold, reset_after=self.circuit_reset
+        )
+
+    def create_rate_limiter(self, share: int = 1) -> AdaptiveRateLimiter:
+        # Processes that split one load each get 1/share of the configured rates.
+        return AdaptiveRateLimiter(
+            rate=self.rate_limit / share,
+            min_rate=self.rate_limit_min / share,
+            max_rate=self.rate_limit_max / share,
+        )
+
+    def setup_logging(self) -> QueueListener:
+        return setup_logging(
+            self.log_file,
+            level=self.log_level,
+            json_lines=self.log_json,
+            sample_rate=self.log_sample,
+        )
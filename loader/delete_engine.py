@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable
+from keycloak_client import KeycloakClient
+
+DELETE_ORDER = ("users", "groups", "roles")
+NAME_KEYS = {"users": "username", "groups": "name", "roles": "name"}
+BUILTIN_ROLES = ("offline_access", "uma_authorization")
+MASTER_ROLES = ("admin", "create-realm")
+
+
+def protected_names(realm: str, users: Iterable[str] = ()) -> dict[str, set[str]]:
+    roles = {f"default-roles-{realm}", *BUILTIN_ROLES}
+    if realm == "master":
+        roles.update(MASTER_ROLES)
+    return {"users": set(users), "groups": set(), "roles": roles}
+
+
+@dataclass(frozen=True)
+class DeleteFilter:
+    name_prefix: str | None = None
+    attribute: tuple[str, str] | None = None
+
+    @classmethod
+    def parse(cls, name_prefix: str | None, attribute: str | None) -> "DeleteFilter":
+        if attribute is None:
+            return cls(name_prefix)
+        key, sep, value = attribute.partition("=")
+        if not key or not sep:
+            raise ValueError(f"Attribute filter must be KEY=VALUE, got '{attribute}'")
+        return cls(name_prefix, (key, value))
+
+    def matches(self, item: dict, name_key: str) -> bool:
+        if self.name_prefix and not item.get(name_key, "").startswith(self.name_prefix):
+            return False
+        if self.attribute:
+            key, value = self.attribute
+            if value not in (item.get("attributes") or {}).get(key, []):
+                return False
+        return True
+
+    def to_dict(self) -> dict:
+        attribute = list(self.attribute) if self.attribute else None
+        return {"name_prefix": self.name_prefix, "attribute": attribute}
+
+
+@dataclass
+class DeleteResult:
+    kind: str
+    deleted: int = 0
+    resumed: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    deleted_ids: list[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (
+            f"Deleted {self.kind}: {self.deleted}, skipped from checkpoint: "
+            f"{self.resumed}, failed: {self.failed}, in {self.elapsed:.1f}s"
+        )
+
+
+class DeleteCheckpoint:
+
+    def __init__(self, path: str | None, delete_filter: DeleteFilter) -> None:
+        self.path = path
+        self.listed: dict[str, list[str]] = {}
+        self.complete: set[str] = set()
+        self.deleted: dict[str, set[str]] = {}
+        self.__lock = threading.Lock()
+        self.__file = None
+        self.__logger = logging.getLogger(__name__)
+        if path is None:
+            return
+        header = {"filter": delete_filter.to_dict()}
+        if os.path.exists(path) and not self.__read(path, header):
+            self.__logger.warning(f"Delete checkpoint {path} has other filters, reset")
+            self.listed, self.complete, self.deleted = {}, set(), {}
+            os.remove(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fresh = not os.path.exists(path)
+        self.__file = open(path, "a", encoding="utf-8")
+        if fresh:
+            self.__write(header)
+
+    def __read(self, path: str, header: dict) -> bool:
+        with open(path, encoding="utf-8") as file:
+            lines = [json.loads(line) for line in file if line.strip()]
+        if not lines or lines[0] != header:
+            return False
+        for entry in lines[1:]:
+            kind = entry["kind"]
+            if "listed" in entry:
+                self.listed.setdefault(kind, []).extend(entry["listed"])
+            elif "deleted" in entry:
+                self.deleted.setdefault(kind, set()).add(entry["deleted"])
+            elif entry.get("complete"):
+                self.complete.add(kind)
+        return True
+
+    def __write(self, entry: dict) -> None:
+        if self.__file is None:
+            return
+        with self.__lock:
+            self.__file.write(json.dumps(entry) + "\n")
+            self.__file.flush()
+
+    def record_page(self, kind: str, ids: list[str]) -> None:
+        self.__write({"kind": kind, "listed": ids})
+
+    def record_listed(self, kind: str) -> None:
+        self.__write({"kind": kind, "complete": True})
+
+    def record_deleted(self, kind: str, object_id: str) -> None:
+        self.__write({"kind": kind, "deleted": object_id})
+
+    def close(self, finished: bool = False) -> None:
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+            if finished and self.path is not None:
+                os.remove(self.path)
+
+
+class DeleteEngine:
+
+    def __init__(
+        self,
+        client: KeycloakClient,
+        realm: str,
+        workers: int = 10,
+        delete_filter: DeleteFilter | None = None,
+        checkpoint: str | None = None,
+        progress_every: int = 1000,
+        protected: dict[str, set[str]] | None = None,
+    ) -> None:
+        if workers < 1:
+            raise ValueError("Workers must be at least 1.")
+        self.__client = client
+        self.__realm_endpoint = f"/admin/realms/{realm}"
+        self.__protected = protected or protected_names(realm)
+        self.__workers = workers
+        self.__filter = delete_filter or DeleteFilter()
+        self.__checkpoint = DeleteCheckpoint(checkpoint, self.__filter)
+        self.__progress_every = progress_every
+        self.__logger = logging.getLogger(__name__)
+
+    def run(self, kinds: tuple[str, ...] = DELETE_ORDER) -> list[DeleteResult]:
+        results = []
+        try:
+            for kind in DELETE_ORDER:
+                if kind in kinds:
+                    results.append(self.delete(kind))
+        finally:
+            finished = len(results) == len(set(kinds) & set(DELETE_ORDER))
+            failed = any(result.failed for result in results)
+            self.__checkpoint.close(finished=finished and not failed)
+        return results
+
+    def delete(self, kind: str) -> DeleteResult:
+        result = DeleteResult(kind)
+        started = time.perf_counter()
+        done = self.__checkpoint.deleted.get(kind, set())
+        ids = [
+            object_id for object_id in self.__list_ids(kind) if object_id not in done
+        ]
+        result.resumed = len(done)
+        delete_endpoint = self.__delete_endpoint(kind)
+        lock = threading.Lock()
+
+        def delete_one(object_id: str) -> None:
+            response = self.__client.delete(delete_endpoint, object_id)
+            with lock:
+                if not response.ok and not response.gone:
+                    result.failed += 1
+                    return
+                result.deleted += 1
+                result.deleted_ids.append(object_id)
+                if result.deleted % self.__progress_every == 0:
+                    self.__logger.info(
+                        f"Delete {kind}: {result.deleted}/{len(ids)} deleted"
+                    )
+            self.__checkpoint.record_deleted(kind, object_id)
+
+        with ThreadPoolExecutor(self.__workers) as executor:
+            for future in [executor.submit(delete_one, i) for i in ids]:
+                future.result()
+        result.elapsed = time.perf_counter() - started
+        self.__logger.info(result.summary())
+        return result
+
+    def __list_ids(self, kind: str) -> list[str]:
+        if kind in self.__checkpoint.complete:
+            return list(dict.fromkeys(self.__checkpoint.listed.get(kind, [])))
+        # Collect every page before deleting: offsets shift as objects disappear.
+        params = {}
+        if self.__filter.attribute:
+            params["briefRepresentation"] = "false"
+        ids, page = [], []
+        endpoint = f"{self.__realm_endpoint}/{kind}"
+        for item in self.__client.paginate(endpoint, params=params):
+            if item.get(NAME_KEYS[kind]) in self.__protected.get(kind, ()):
+                continue
+            if self.__filter.matches(item, NAME_KEYS[kind]):
+                page.append(item["id"])
+            if len(page) >= self.__client.page_size:
+                self.__checkpoint.record_page(kind, page)
+                ids.extend(page)
+                page = []
+        self.__checkpoint.record_page(kind, page)
+        self.__checkpoint.record_listed(kind)
+        return ids + page
+
+    def __delete_endpoint(self, kind: str) -> str:
+        if kind == "roles":
+            return f"{self.__realm_endpoint}/roles-by-id/"
+        return f"{self.__realm_endpoint}/{kind}/"
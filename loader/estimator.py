@@ -0,0 +1,297 @@
+import json
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable
+from delete_engine import DELETE_ORDER, NAME_KEYS, DeleteFilter
+from payloads import split_names
+from realm_snapshot import RealmSnapshot
+from rows import SheetRow
+
+REALM = "/admin/realms/{realm}"
+METHODS = ("GET", "POST", "PUT", "DELETE")
+
+
+def pages(items: int, page_size: int) -> int:
+    # paginate stops on the first short page, so a full last page costs one more GET
+    return items // page_size + 1
+
+
+def throttle_floor(requests: int, rate: float, max_rate: float) -> float:
+    # The limiter adds 1 req/s per response until it reaches max_rate.
+    ramp = min(requests, max(0.0, max_rate - rate))
+    return math.log((rate + ramp) / rate) + (requests - ramp) / max_rate
+
+
+class LatencyModel:
+    def __init__(self, default: float = 0.02) -> None:
+        self.default = default
+        self.endpoints: dict[tuple[str, str], float] = {}
+        self.methods: dict[str, float] = {}
+
+    @classmethod
+    def from_metrics_json(cls, path: str, default: float = 0.02) -> "LatencyModel":
+        with open(path, encoding="utf-8") as file:
+            report = json.load(file)
+        model = cls(default)
+        totals: dict[tuple[str, str], list[float]] = {}
+        for entry in report["endpoints"]:
+            key = (entry["method"], entry["endpoint"])
+            count, seconds = totals.setdefault(key, [0, 0.0])
+            totals[key] = [count + entry["count"], seconds + entry["seconds"]]
+        methods: dict[str, list[float]] = {}
+        for (method, endpoint), (count, seconds) in totals.items():
+            if count:
+                model.endpoints[(method, endpoint)] = seconds / count
+                method_total = methods.setdefault(method, [0, 0.0])
+                method_total[0] += count
+                method_total[1] += seconds
+        model.methods = {
+            method: seconds / count for method, (count, seconds) in methods.items()
+        }
+        return model
+
+    def latency(self, method: str, endpoint: str) -> float:
+        if (method, endpoint) in self.endpoints:
+            return self.endpoints[(method, endpoint)]
+        return self.methods.get(method, self.default)
+
+
+@dataclass
+class PhaseEstimate:
+    name: str
+    concurrency: int = 1
+    listing: Counter = field(default_factory=Counter)
+    objects: Counter = field(default_factory=Counter)
+
+    def list(self, endpoint: str, count: int = 1) -> None:
+        self.listing[("GET", endpoint)] += count
+
+    def add(self, method: str, endpoint: str, count: int = 1) -> None:
+        self.objects[(method, endpoint)] += count
+
+    @property
+    def requests(self) -> Counter:
+        return self.listing + self.objects
+
+    def by_method(self) -> Counter:
+        methods: Counter[str] = Counter()
+        for (method, _), count in self.requests.items():
+            methods[method] += count
+        return methods
+
+    def seconds(self, latency: LatencyModel) -> tuple[float, float]:
+        listing = sum(
+            count * latency.latency(*key) for key, count in self.listing.items()
+        )
+        objects = sum(
+            count * latency.latency(*key) for key, count in self.objects.items()
+        )
+        # Listing pages are fetched one after another; object requests fan out.
+        return listing + objects, listing + objects / max(1, self.concurrency)
+
+
+class RequestEstimator:
+
+    def __init__(
+        self,
+        protected: dict[str, set[str]],
+        snapshot: RealmSnapshot | None = None,
+        page_size: int = 100,
+    ) -> None:
+        snapshot = snapshot if snapshot is not None else RealmSnapshot()
+        self.protected = protected
+        self.page_size = page_size
+        self.roles = set(snapshot.roles or {})
+        self.groups = dict(snapshot.groups or {})
+        self.users = dict(snapshot.users or {})
+        group_names = {group_id: name for name, group_id in self.groups.items()}
+        self.group_roles = {
+            group_names[group_id]: set(roles)
+            for group_id, roles in snapshot.group_roles.items()
+            if group_id in group_names
+        }
+        usernames = {user_id: name for name, user_id in self.users.items()}
+        self.user_groups = {
+            usernames[user_id]: set(groups)
+            for user_id, groups in snapshot.user_groups.items()
+            if user_id in usernames
+        }
+
+    def sync(
+        self,
+        roles: Iterable[dict | SheetRow] | None = None,
+        groups: Iterable[dict | SheetRow] | None = None,
+        users: Iterable[dict | SheetRow] | None = None,
+        concurrency: int = 1,
+        shards: int = 1,
+    ) -> list[PhaseEstimate]:
+        phases = []
+        known_roles = set(self.roles)
+        created_roles: set[str] = set()
+        created_groups: set[str] = set()
+        listed = set()
+
+        def ensure(phase: PhaseEstimate, kind: str, count: int) -> None:
+            if kind not in listed:
+                listed.add(kind)
+                phase.list(f"{REALM}/{kind}", pages(count, self.page_size))
+
+        if roles is not None:
+            phase = PhaseEstimate("roles", concurrency)
+            ensure(phase, "roles", len(self.roles))
+            for name in dict.fromkeys(role["Role"] for role in roles):
+                if name in self.roles:
+                    phase.add("PUT", f"{REALM}/roles/{{role}}")
+                else:
+                    phase.add("POST", f"{REALM}/roles")
+                    created_roles.add(name)
+                known_roles.add(name)
+            phases.append(phase)
+
+        if groups is not None:
+            phase = PhaseEstimate("groups", concurrency)
+            ensure(phase, "groups", len(self.groups))
+            ensure(phase, "roles", len(self.roles))
+            fetched_roles: set[str] = set()
+            for group in groups:
+                name = group["Name"]
+                if name in self.groups:
+                    phase.add("PUT", f"{REALM}/groups/{{id}}")
+                    phase.add("GET", f"{REALM}/groups/{{id}}/role-mappings/realm")
+                    current = self.group_roles.get(name, set())
+                else:
+                    phase.add("POST", f"{REALM}/groups")
+                    created_groups.add(name)
+                    current = set()
+                missing = [
+                    role
+                    for role in dict.fromkeys(split_names(group.get("Role", "")))
+                    if role not in current and role in known_roles
+                ]
+                # Roles created in this run are looked up once to learn their id.
+                for role in missing:
+                    if role in created_roles and role not in fetched_roles:
+                        fetched_roles.add(role)
+                        phase.add("GET", f"{REALM}/roles/{{role}}")
+                if missing:
+                    phase.add("POST", f"{REALM}/groups/{{id}}/role-mappings/realm")
+            phases.append(phase)
+
+        if users is not None:
+            phase = PhaseEstimate("users", shards if shards > 1 else concurrency)
+            ensure(phase, "users", len(self.users))
+            ensure(phase, "groups", len(self.groups))
+            known_groups = set(self.groups) | created_groups
+            prefetched = len(self.users) > len(known_groups)
+            if prefetched:
+                members = Counter(
+                    group for names in self.user_groups.values() for group in names
+                )
+                for group_name in known_groups:
+                    phase.list(
+                        f"{REALM}/groups/{{id}}/members",
+                        pages(members[group_name], self.page_size),
+                    )
+            for username, wanted in self.__aggregate_users(users).items():
+                if username in self.users:
+                    phase.add("PUT", f"{REALM}/users/{{id}}")
+                    current = self.user_groups.get(username, set())
+                    if not prefetched:
+                        phase.add(
+                            "GET",
+                            f"{REALM}/users/{{id}}/groups",
+                            pages(len(current), self.page_size),
+                        )
+                else:
+                    phase.add("POST", f"{REALM}/users")
+                    current = set()
+                joins = (wanted - current) & known_groups
+                if joins:
+                    phase.add("PUT", f"{REALM}/users/{{id}}/groups/{{id}}", len(joins))
+            phases.append(phase)
+        return phases
+
+    def bulk(
+        self,
+        roles: Iterable[dict | SheetRow] | None = None,
+        groups: Iterable[dict | SheetRow] | None = None,
+        users: Iterable[dict | SheetRow] | None = None,
+        chunk_size: int = 500,
+    ) -> list[PhaseEstimate]:
+        phase = PhaseEstimate("bulk")
+        sections = (
+            {role["Role"] for role in roles or ()},
+            {group["Name"] for group in groups or ()},
+            {user["Username"] for user in users or ()},
+        )
+        for names in sections:
+            phase.add(
+                "POST", f"{REALM}/partialImport", math.ceil(len(names) / chunk_size)
+            )
+        return [phase]
+
+    def delete(
+        self, workers: int = 1, delete_filter: DeleteFilter | None = None
+    ) -> list[PhaseEstimate]:
+        phase = PhaseEstimate("delete", workers)
+        # Attributes are not in the snapshot, so only the name prefix narrows the count.
+        delete_filter = DeleteFilter((delete_filter or DeleteFilter()).name_prefix)
+        names = {"users": self.users, "groups": self.groups, "roles": self.roles}
+        for kind in DELETE_ORDER:
+            existing = names[kind]
+            phase.list(f"{REALM}/{kind}", pages(len(existing), self.page_size))
+            deleted = sum(
+                1
+                for name in existing
+                if name not in self.protected.get(kind, ())
+                and delete_filter.matches({NAME_KEYS[kind]: name}, NAME_KEYS[kind])
+            )
+            endpoint = "roles-by-id" if kind == "roles" else kind
+            phase.add("DELETE", f"{REALM}/{endpoint}/{{id}}", deleted)
+        return [phase]
+
+    def __aggregate_users(
+        self, users: Iterable[dict | SheetRow]
+    ) -> dict[str, set[str]]:
+        aggregated: dict[str, set[str]] = {}
+        for user in users:
+            names = aggregated.setdefault(user["Username"], set())
+            names.update(split_names(user.get("Group", "")))
+        return aggregated
+
+
+def estimate_report(
+    phases: list[PhaseEstimate],
+    latency: LatencyModel,
+    rate: float,
+    max_rate: float,
+) -> str:
+    header = f"{'phase':<10}{'method':<7}{'endpoint':<52}{'count':>9}{'ms':>8}"
+    lines = [header]
+    total_requests, total_wall = 0, 0.0
+    for phase in phases:
+        for (method, endpoint), count in sorted(phase.requests.items()):
+            milliseconds = latency.latency(method, endpoint) * 1000
+            lines.append(
+                f"{phase.name:<10}{method:<7}{endpoint:<52}{count:>9}{milliseconds:>8.1f}"
+            )
+    lines.append("")
+    for phase in phases:
+        requests = sum(phase.requests.values())
+        serial, wall = phase.seconds(latency)
+        wall = max(wall, throttle_floor(requests, rate, max_rate))
+        rate = min(max_rate, rate + requests)
+        methods = phase.by_method()
+        counts = ", ".join(f"{method} {methods[method]}" for method in METHODS)
+        lines.append(
+            f"{phase.name:<10}{requests:>9} requests ({counts}), "
+            f"{serial:.1f}s serial, ~{wall:.1f}s at concurrency {phase.concurrency}"
+        )
+        total_requests += requests
+        total_wall += wall
+    lines.append(
+        f"Total: {total_requests} requests, projected wall time "
+        f"~{total_wall:.1f}s ({total_wall / 60:.1f} min)"
+    )
+    return "\n".join(lines)
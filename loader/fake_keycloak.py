@@ -0,0 +1,452 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeKeycloakState:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.roles: dict[str, dict] = {}
+        self.groups: dict[str, dict] = {}
+        self.users: dict[str, dict] = {}
+        self.group_roles: dict[str, set[str]] = {}
+        self.user_groups: dict[str, set[str]] = {}
+        self.connections = 0
+        self.requests = 0
+        self.token_lifetime = 60
+        self.expire_tokens = False
+        self.tokens: dict[str, float] = {}
+        self.refresh_tokens: set[str] = set()
+        self.grants: Counter = Counter()
+        self.user_ids: dict[str, str] = {}
+        self.group_ids: dict[str, str] = {}
+        self.latency = 0.0
+        self.jitter = 0.0
+        self.error_rate = 0.0
+        self.error_status = 503
+        self.injected = 0
+
+
+class FakeKeycloakHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state: FakeKeycloakState
+
+    def setup(self) -> None:
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.__dispatch("GET")
+
+    def do_POST(self) -> None:
+        self.__dispatch("POST")
+
+    def do_PUT(self) -> None:
+        self.__dispatch("PUT")
+
+    def do_DELETE(self) -> None:
+        self.__dispatch("DELETE")
+
+    def __dispatch(self, method: str) -> None:
+        with self.state.lock:
+            self.state.requests += 1
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        body = self.__read_body()
+        if self.state.latency or self.state.jitter:
+            time.sleep(self.state.latency + random.uniform(0, self.state.jitter))
+        if method == "POST" and path.endswith("/protocol/openid-connect/token"):
+            with self.state.lock:
+                status, payload = self.__token(body or {})
+            return self.__send(status, payload)
+        if not self.__authorized():
+            return self.__send(401, {"error": "HTTP 401 Unauthorized"})
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            with self.state.lock:
+                self.state.injected += 1
+            return self.__send(self.state.error_status, {"error": "injected"})
+        parts = path.split("/")
+        if len(parts) < 5 or parts[1:3] != ["admin", "realms"]:
+            return self.__send(404, {"error": "not found"})
+        routes = {
+            "roles": self.__roles,
+            "roles-by-id": self.__roles_by_id,
+            "groups": self.__groups,
+            "users": self.__users,
+            "partialImport": self.__partial_import,
+        }
+        route = routes.get(parts[4])
+        if route is None:
+            return self.__send(404, {"error": "not found"})
+        with self.state.lock:
+            status, payload, location = route(method, parts[5:], body, query)
+        self.__send(status, payload, location)
+
+    def __token(self, form: dict):
+        state = self.state
+        grant_type = form.get("grant_type")
+        state.grants[grant_type] += 1
+        if grant_type == "refresh_token":
+            if form.get("refresh_token") not in state.refresh_tokens:
+                return 400, {"error": "invalid_grant"}
+            state.refresh_tokens.discard(form["refresh_token"])
+        elif grant_type == "client_credentials" and not form.get("client_secret"):
+            return 401, {"error": "unauthorized_client"}
+        elif grant_type not in ("password", "client_credentials"):
+            return 400, {"error": "unsupported_grant_type"}
+        access_token = str(uuid.uuid4())
+        state.tokens[access_token] = time.monotonic() + state.token_lifetime
+        token: dict[str, Any] = {
+            "access_token": access_token,
+            "token_type": "Bearer",
+            "expires_in": state.token_lifetime,
+        }
+        if grant_type != "client_credentials":
+            token["refresh_token"] = str(uuid.uuid4())
+            token["refresh_expires_in"] = state.token_lifetime * 30
+            state.refresh_tokens.add(token["refresh_token"])
+        return 200, token
+
+    def __authorized(self) -> bool:
+        if not self.state.expire_tokens:
+            return True
+        _, _, token = self.headers.get("Authorization", "").partition(" ")
+        with self.state.lock:
+            return self.state.tokens.get(token, 0) > time.monotonic()
+
+    def __roles(self, method: str, rest: list[str], body, query: dict):
+        roles = self.state.roles
+        if not rest:
+            if method == "GET":
+                return 200, self.__page(list(roles.values()), query), None
+            if method == "POST":
+                if body["name"] in roles:
+                    return 409, {"errorMessage": "Role exists"}, None
+                role = {**body, "id": str(uuid.uuid4())}
+                roles[role["name"]] = role
+                return 201, None, f"roles/{role['name']}"
+        elif rest[0] in roles:
+            if method == "GET":
+                return 200, roles[rest[0]], None
+            if method == "PUT":
+                roles[rest[0]].update(body or {})
+                return 204, None, None
+        return 404, {"error": "not found"}, None
+
+    def __roles_by_id(self, method: str, rest: list[str], body, query: dict):
+        for name, role in list(self.state.roles.items()):
+            if rest and role["id"] == rest[0] and method == "DELETE":
+                del self.state.roles[name]
+                for assigned in self.state.group_roles.values():
+                    assigned.discard(role["id"])
+                return 204, None, None
+        return 404, {"error": "not found"}, None
+
+    def __groups(self, method: str, rest: list[str], body, query: dict):
+        groups = self.state.groups
+        if not rest:
+            if method == "GET":
+                search = query.get("search")
+                found = [
+                    group
+                    for group in groups.values()
+                    if not search or search in group["name"]
+                ]
+                return 200, self.__page(found, query), None
+            if method == "POST":
+                if body["name"] in self.state.group_ids:
+                    return 409, {"errorMessage": "Group exists"}, None
+                created = {**body, "id": str(uuid.uuid4()), "subGroups": []}
+                groups[created["id"]] = created
+                self.state.group_ids[created["name"]] = created["id"]
+                self.state.group_roles[created["id"]] = set()
+                return 201, None, f"groups/{created['id']}"
+            return 404, {"error": "not found"}, None
+        group = groups.get(rest[0])
+        if group is None:
+            return 404, {"error": "not found"}, None
+        if len(rest) == 1:
+            if method == "GET":
+                return (
+                    200,
+                    {**group, "realmRoles": self.__group_role_names(group)},
+                    None,
+                )
+            if method == "PUT":
+                self.state.group_ids.pop(group["name"], None)
+                group.update(body or {})
+                self.state.group_ids[group["name"]] = group["id"]
+                return 204, None, None
+            if method == "DELETE":
+                del groups[rest[0]]
+                self.state.group_ids.pop(group["name"], None)
+                self.state.group_roles.pop(rest[0], None)
+                for assigned in self.state.user_groups.values():
+                    assigned.discard(rest[0])
+                return 204, None, None
+        if rest[1:] == ["members"] and method == "GET":
+            members = [
+                self.__public_user(self.state.users[user_id])
+                for user_id, assigned in self.state.user_groups.items()
+                if group["id"] in assigned
+            ]
+            return 200, self.__page(members, query), None
+        if rest[1:] == ["role-mappings", "realm"]:
+            assigned = self.state.group_roles[group["id"]]
+            if method == "GET":
+                return 200, self.__roles_for_ids(assigned), None
+            if method == "POST":
+                assigned.update(role["id"] for role in body)
+                return 204, None, None
+            if method == "DELETE":
+                assigned.difference_update(role["id"] for role in body)
+                return 204, None, None
+        return 404, {"error": "not found"}, None
+
+    def __users(self, method: str, rest: list[str], body, query: dict):
+        users = self.state.users
+        if not rest:
+            if method == "GET":
+                username = query.get("username")
+                if username is None:
+                    found = list(users.values())
+                else:
+                    user_id = self.state.user_ids.get(username)
+                    found = [users[user_id]] if user_id else []
+                found = self.__page(found, query)
+                return 200, [self.__public_user(user) for user in found], None
+            if method == "POST":
+                if body["username"] in self.state.user_ids:
+                    return 409, {"errorMessage": "User exists"}, None
+                created = {**body, "id": str(uuid.uuid4())}
+                users[created["id"]] = created
+                self.state.user_ids[created["username"]] = created["id"]
+                self.state.user_groups[created["id"]] = set()
+                return 201, None, f"users/{created['id']}"
+            return 404, {"error": "not found"}, None
+        user = users.get(rest[0])
+        if user is None:
+            return 404, {"error": "not found"}, None
+        if len(rest) == 1:
+            if method == "GET":
+                return 200, self.__public_user(user), None
+            if method == "PUT":
+                self.state.user_ids.pop(user["username"], None)
+                user.update(body or {})
+                self.state.user_ids[user["username"]] = user["id"]
+                return 204, None, None
+            if method == "DELETE":
+                del users[rest[0]]
+                self.state.user_ids.pop(user["username"], None)
+                self.state.user_groups.pop(rest[0], None)
+                return 204, None, None
+        if rest[1] == "groups":
+            assigned = self.state.user_groups[user["id"]]
+            if len(rest) == 2 and method == "GET":
+                found = [self.state.groups[gid] for gid in assigned]
+                return 200, self.__page(found, query), None
+            if len(rest) == 3 and rest[2] in self.state.groups:
+                if method == "PUT":
+                    assigned.add(rest[2])
+                    return 204, None, None
+                if method == "DELETE":
+                    assigned.discard(rest[2])
+                    return 204, None, None
+        return 404, {"error": "not found"}, None
+
+    def __partial_import(self, method: str, rest: list[str], body, query: dict):
+        if method != "POST" or rest:
+            return 404, {"error": "not found"}, None
+        state = self.state
+        policy = body.get("ifResourceExists", "FAIL")
+        roles = body.get("roles", {}).get("realm", [])
+        groups = body.get("groups", [])
+        users = body.get("users", [])
+        group_ids = state.group_ids
+        user_ids = state.user_ids
+        if policy == "FAIL" and (
+            any(role["name"] in state.roles for role in roles)
+            or any(group["name"] in group_ids for group in groups)
+            or any(user["username"] in user_ids for user in users)
+        ):
+            return 409, {"errorMessage": "Resource already exists"}, None
+
+        results = []
+
+        def record(resource_type: str, name: str, object_id: str, existed: bool):
+            if not existed:
+                action = "ADDED"
+            elif policy == "OVERWRITE":
+                action = "OVERWRITTEN"
+            else:
+                action = "SKIPPED"
+            results.append(
+                {
+                    "action": action,
+                    "resourceType": resource_type,
+                    "resourceName": name,
+                    "id": object_id,
+                }
+            )
+            return action != "SKIPPED"
+
+        for role in roles:
+            existing = state.roles.get(role["name"])
+            role_id = existing["id"] if existing else str(uuid.uuid4())
+            if record("REALM_ROLE", role["name"], role_id, existing is not None):
+                state.roles[role["name"]] = {**role, "id": role_id}
+        role_ids = {name: role["id"] for name, role in state.roles.items()}
+        for group in groups:
+            group_id = group_ids.get(group["name"]) or str(uuid.uuid4())
+            existed = group["name"] in group_ids
+            if record("GROUP", group["name"], group_id, existed):
+                realm_roles = group.get("realmRoles", [])
+                state.groups[group_id] = {
+                    "name": group["name"],
+                    "attributes": group.get("attributes", {}),
+                    "id": group_id,
+                    "subGroups": [],
+                }
+                state.group_roles[group_id] = {
+                    role_ids[name] for name in realm_roles if name in role_ids
+                }
+                group_ids[group["name"]] = group_id
+        for user in users:
+            user_id = user_ids.get(user["username"]) or str(uuid.uuid4())
+            existed = user["username"] in user_ids
+            if record("USER", user["username"], user_id, existed):
+                paths = user.get("groups", [])
+                state.users[user_id] = {
+                    key: value for key, value in user.items() if key != "groups"
+                } | {"id": user_id}
+                user_ids[user["username"]] = user_id
+                state.user_groups[user_id] = {
+                    group_ids[path.lstrip("/")]
+                    for path in paths
+                    if path.lstrip("/") in group_ids
+                }
+        actions = [result["action"] for result in results]
+        return (
+            200,
+            {
+                "added": actions.count("ADDED"),
+                "overwritten": actions.count("OVERWRITTEN"),
+                "skipped": actions.count("SKIPPED"),
+                "results": results,
+            },
+            None,
+        )
+
+    def __page(self, items: list, query: dict) -> list:
+        first = int(query.get("first", 0))
+        if "max" in query:
+            return items[first : first + int(query["max"])]
+        return items[first:]
+
+    def __group_role_names(self, group: dict) -> list[str]:
+        assigned = self.state.group_roles.get(group["id"], set())
+        return [role["name"] for role in self.__roles_for_ids(assigned)]
+
+    def __roles_for_ids(self, role_ids: set[str]) -> list[dict]:
+        return [role for role in self.state.roles.values() if role["id"] in role_ids]
+
+    def __public_user(self, user: dict) -> dict:
+        return {key: value for key, value in user.items() if key != "credentials"}
+
+    def __read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        raw = self.rfile.read(length)
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            return json.loads(raw)
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            return {key: values[-1] for key, values in parse_qs(raw.decode()).items()}
+        return None
+
+    def __send(self, status: int, payload, location: str | None = None) -> None:
+        raw = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        if location:
+            base = self.path.split("?")[0].rstrip("/")
+            base = base[: base.index("/", len("/admin/realms/")) + 1]
+            self.send_header("Location", f"{self.__base_url()}{base}{location}")
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def __base_url(self) -> str:
+        host, port = self.server.socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+
+class FakeKeycloakServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.state = FakeKeycloakState()
+        handler = type("Handler", (FakeKeycloakHandler,), {"state": self.state})
+        self.__server = ThreadingHTTPServer((host, port), handler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(
+            target=self.__server.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeKeycloakServer":
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self) -> "FakeKeycloakServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a fake Keycloak admin API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = FakeKeycloakServer(args.host, args.port)
+    server.state.latency = args.latency
+    server.state.jitter = args.jitter
+    server.state.error_rate = args.error_rate
+    server.state.error_status = args.error_status
+    with server:
+        print(f"Fake Keycloak listening on {server.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,33 @@
+import hashlib
+import json
+import os
 import pandas as pd
+from typing import Iterator
+from sources import open_source
 
 
 class FileHandler:
+    __workbooks: dict[tuple[str, int, int], dict[str, pd.DataFrame]] = {}
 
-    def __init__(self, path: str, sheet: str = "Roles") -> None:
+    def __init__(
+        self,
+        path: str,
+        sheet: str = "Roles",
+        sidecar: bool = False,
+        sources: dict[str, str] | None = None,
+    ) -> None:
         self.__path = path
         self.__sheet = sheet
+        self.__sidecar = sidecar
+        self.__sources = sources or {}
+        # None while the sheet comes from a separate source that was not read yet.
+        self._dataframe: pd.DataFrame | None = None
         self.__setup_df()
 
+    @classmethod
+    def clear_cache(cls) -> None:
+        cls.__workbooks = {}
+
     def path(self) -> str:
         return self.__path
 
@@ -20,23 +40,30 @@ class FileHandler:
         self.__sheet = value
         self.__setup_df()
 
-    def get_headers(self) -> list[str]:
+    def __source_dataframe(self) -> pd.DataFrame:
         if self._dataframe is None:
-            raise ValueError(
-                "Dataframe is not initialized. Ensure the file and sheet are correctly loaded."
-            )
-        return self._dataframe.columns.tolist()
+            source = open_source(self.__sources[self.sheet], self.sheet)
+            self._dataframe = source.read_all()
+        return self._dataframe
+
+    def get_headers(self) -> list[str]:
+        return self.__source_dataframe().columns.tolist()
 
     def __setup_df(self):
+        if self.sheet in self.__sources:
+            self._dataframe = None
+            return
         try:
             if not self.__path:
                 raise ValueError("File path cannot be empty.")
-            self._dataframe = pd.read_excel(self.__path, self.sheet)
+            sheets = self.__load_workbook()
+            if self.sheet not in sheets:
+                raise ValueError(f"Worksheet named '{self.sheet}' not found")
+            self._dataframe = sheets[self.sheet]
             if self._dataframe.empty:
                 raise ValueError(
                     f"The sheet '{self.sheet}' in file '{self.__path}' is empty."
                 )
-            self._dataframe = self._dataframe.ffill(axis=0)
         except FileNotFoundError:
             raise FileNotFoundError(f"The file at path '{self.__path}' was not found.")
         except ValueError as ve:
@@ -44,44 +71,134 @@ class FileHandler:
         except Exception as e:
             raise Exception(f"An unexpected error occurred: {e}")
 
+    def __load_workbook(self) -> dict[str, pd.DataFrame]:
+        stat = os.stat(self.__path)
+        key = (os.path.abspath(self.__path), stat.st_mtime_ns, stat.st_size)
+        sheets = FileHandler.__workbooks.get(key)
+        if sheets is not None:
+            return sheets
+        digest = self.__file_digest() if self.__sidecar else None
+        sheets = self.__read_sidecar(digest) if digest else None
+        if sheets is None:
+            sheets = {
+                name: dataframe.ffill(axis=0)
+                for name, dataframe in pd.read_excel(
+                    self.__path, sheet_name=None
+                ).items()
+            }
+            if digest:
+                self.__write_sidecar(digest, sheets)
+        FileHandler.__workbooks = {
+            cached: value
+            for cached, value in FileHandler.__workbooks.items()
+            if cached[0] != key[0]
+        }
+        FileHandler.__workbooks[key] = sheets
+        return sheets
+
+    def __sidecar_path(self) -> str:
+        return f"{self.__path}.sheets.json"
+
+    def __file_digest(self) -> str:
+        sha = hashlib.sha256()
+        with open(self.__path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def __read_sidecar(self, digest: str) -> dict[str, pd.DataFrame] | None:
+        # The digest sits on its own first line, so a stale file is never parsed.
+        try:
+            with open(self.__sidecar_path(), encoding="utf-8") as file:
+                if file.readline().strip() != digest:
+                    return None
+                cached = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return {
+            name: pd.DataFrame(
+                sheet["data"], index=sheet["index"], columns=sheet["columns"]
+            )
+            for name, sheet in cached.items()
+        }
+
+    def __write_sidecar(self, digest: str, sheets: dict[str, pd.DataFrame]) -> None:
+        temporary = f"{self.__sidecar_path()}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as file:
+                file.write(digest + "\n")
+                json.dump(
+                    {
+                        name: dataframe.to_dict(orient="split")
+                        for name, dataframe in sheets.items()
+                    },
+                    file,
+                    default=str,
+                )
+            os.replace(temporary, self.__sidecar_path())
+        except (OSError, TypeError, ValueError):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
     def dataFrame_to_dict(self):
-        return self._dataframe.to_dict(orient="index").values()
+        return self.__source_dataframe().to_dict(orient="index").values()
 
     def dataframe_merge(self, dataframe: pd.DataFrame, key: str = ""):
         if not isinstance(dataframe, pd.DataFrame):
             raise TypeError("The provided argument is not a valid pandas DataFrame.")
-        if key not in self._dataframe.columns or key not in dataframe.columns:
+        current = self.__source_dataframe()
+        if key not in current.columns or key not in dataframe.columns:
             raise KeyError(
                 f"The key '{key}' must be present in both DataFrames for merging."
             )
-        self._dataframe = pd.merge(self._dataframe, dataframe, on=key)
+        self._dataframe = pd.merge(current, dataframe, on=key)
 
     def data_frame_group(self, key: str, column_name: str):
-        if key not in self._dataframe.columns:
+        current = self.__source_dataframe()
+        if key not in current.columns:
             raise KeyError(f"The key '{key}' is not in the DataFrame columns.")
-        if column_name not in self._dataframe.columns:
+        if column_name not in current.columns:
             raise KeyError(
                 f"The column '{column_name}' is not in the DataFrame columns."
             )
-        self._dataframe = self._dataframe.groupby(key).agg(
-            {
-                col: "first" if col != column_name else list
-                for col in self._dataframe.columns
-            }
+        self._dataframe = current.groupby(key).agg(
+            {col: "first" if col != column_name else list for col in current.columns}
         )
 
     def get_fields(self, *args: str) -> list[dict]:
-        if not all(arg in self._dataframe.columns for arg in args):
-            missing = [arg for arg in args if arg not in self._dataframe.columns]
+        dataframe = self._dataframe
+        if dataframe is None:
+            return list(self.iter_fields(*args))
+        if not all(arg in dataframe.columns for arg in args):
+            missing = [arg for arg in args if arg not in dataframe.columns]
+            raise KeyError(
+                f"The following fields are missing from the DataFrame: {missing}"
+            )
+        return dataframe[list(args)].to_dict(orient="records")
+
+    def iter_frames(
+        self, *args: str, chunk_size: int | None = None
+    ) -> Iterator[pd.DataFrame]:
+        dataframe = self._dataframe
+        if dataframe is None:
+            source = open_source(self.__sources[self.sheet], self.sheet)
+            return source.iter_chunks(*args, chunk_size=chunk_size or 10000)
+        if not all(arg in dataframe.columns for arg in args):
+            missing = [arg for arg in args if arg not in dataframe.columns]
             raise KeyError(
                 f"The following fields are missing from the DataFrame: {missing}"
             )
-        datas = self.dataFrame_to_dict()
-        response = []
-        for data in datas:
-            small_dict = {arg: data.get(arg, None) for arg in args}
-            response.append(small_dict)
-        return response
+        columns = dataframe[list(args)]
+        if chunk_size is None:
+            return iter([columns])
+        return (
+            columns.iloc[start : start + chunk_size]
+            for start in range(0, len(columns), chunk_size)
+        )
+
+    def iter_fields(self, *args: str, chunk_size: int = 10000) -> Iterator[dict]:
+        frames = self.iter_frames(*args, chunk_size=chunk_size)
+        return (row for frame in frames for row in frame.to_dict(orient="records"))
 
     def get_dataframe(self):
-        return self._dataframe
+        return self.__source_dataframe()
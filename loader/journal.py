@@ -0,0 +1,53 @@
+import hashlib
+import json
+import os
+from typing import Iterable, Iterator
+from rows import SheetRow
+
+
+def row_hash(row: dict | SheetRow) -> str:
+    if isinstance(row, SheetRow):
+        row = row.to_dict()
+    encoded = json.dumps(row, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class LoadJournal:
+
+    def __init__(self, path: str, resume: bool = False) -> None:
+        self.path = path
+        self.applied: dict[str, set[str]] = {}
+        self.skipped = 0
+        if resume and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.applied.setdefault(entry["phase"], set()).add(entry["row"])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.__file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def pending(
+        self, phase: str, rows: Iterable[dict | SheetRow]
+    ) -> Iterator[dict | SheetRow]:
+        applied = self.applied.get(phase, set())
+        for row in rows:
+            if row_hash(row) in applied:
+                self.skipped += 1
+                continue
+            yield row
+
+    def record(self, phase: str, row: dict | SheetRow) -> None:
+        key = row_hash(row)
+        self.applied.setdefault(phase, set()).add(key)
+        self.__file.write(json.dumps({"phase": phase, "row": key}) + "\n")
+        self.__file.flush()
+
+    def close(self) -> None:
+        self.__file.close()
+
+    def __enter__(self) -> "LoadJournal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
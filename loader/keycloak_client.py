@@ -1,56 +1,284 @@
 import requests
 import logging
-from utilities import handle_request_errors, delay
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator
+from requests.adapters import HTTPAdapter
+from logging_setup import request_fields
+from metrics import Metrics
+from rate_limiter import AdaptiveRateLimiter, RequestSlots
+from token_manager import TokenManager
+from retry_policy import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RequestResult,
+    RetryPolicy,
+)
+
+
+def create_session(pool_size: int = 10) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+@dataclass
+class RequestCounts:
+    failures: Counter = field(default_factory=Counter)
+    retries: int = 0
+    circuit_opened: int = 0
+    requests: int = 0
+    throttled: float = 0.0
+    backoffs: int = 0
 
 
 class KeycloakClient:
-    def __init__(self, host: str, realm: str, token_type: str, access_token: str):
+    def __init__(
+        self,
+        host: str,
+        realm: str,
+        token_type: str | None = None,
+        access_token: str | None = None,
+        session: requests.Session | None = None,
+        timeout: tuple[float, float] = (5, 30),
+        rate_limiter: AdaptiveRateLimiter | None = None,
+        page_size: int = 100,
+        prefetch: bool = True,
+        token_manager: TokenManager | None = None,
+        retry_policy: RetryPolicy | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        metrics: Metrics | None = None,
+        request_slots: RequestSlots | None = None,
+    ):
         self.host = host
         self.realm = realm
         self.headers = {
             "Authorization": f"{token_type} {access_token}",
             "Content-Type": "application/json",
         }
-        logging.basicConfig(
-            filename="logs.log",
-            format="%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s",
-            level=logging.INFO,
+        self.session = session if session is not None else create_session()
+        self.timeout = timeout
+        self.rate_limiter = (
+            rate_limiter if rate_limiter is not None else AdaptiveRateLimiter()
+        )
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.token_manager = token_manager
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = (
+            circuit_breaker if circuit_breaker is not None else CircuitBreaker()
         )
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.request_slots = request_slots
+        self.failures: Counter[str] = Counter()
+        self.retries = 0
+        self.__stats_lock = threading.Lock()
         self.__logger = logging.getLogger(__name__)
 
-    @delay(delay_ms=10)
-    @handle_request_errors
-    def get(self, endpoint: str, params: dict = None) -> dict:
-        response = requests.get(
-            f"{self.host}{endpoint}", headers=self.headers, params=params
-        )
-        log = f"GET url: {endpoint}   {str(response.status_code)}"
-        self.__logger.info(log)
-        response.raise_for_status()
-        return response.json()
-
-    @delay(delay_ms=10)
-    @handle_request_errors
-    def post(self, endpoint: str, data: dict) -> dict:
-        response = requests.post(
-            f"{self.host}{endpoint}", headers=self.headers, json=data
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "KeycloakClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __call(self, method: str, endpoint: str, **kwargs) -> RequestResult:
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.circuit_breaker.check()
+                response = self.__send(method, endpoint, **kwargs)
+            except CircuitOpenError as e:
+                error = f"{type(e).__name__}: {str(e)}"
+                return self.__failed(RequestResult(method, endpoint, error=error))
+            except requests.RequestException as e:
+                self.circuit_breaker.failure()
+                connection_error = isinstance(e, requests.ConnectionError)
+                if self.retry_policy.should_retry(
+                    method, attempt, connection_error=connection_error
+                ):
+                    self.__wait(method, endpoint, attempt)
+                    continue
+                error = f"{type(e).__name__}: {str(e)}"
+                result = RequestResult(method, endpoint, error=error, attempts=attempt)
+                return self.__failed(result)
+            status = response.status_code
+            if status >= 500:
+                self.circuit_breaker.failure()
+            else:
+                self.circuit_breaker.success()
+            if status >= 400 and self.retry_policy.should_retry(
+                method, attempt, status=status
+            ):
+                self.__wait(method, endpoint, attempt)
+                continue
+            result = RequestResult(method, endpoint, status, response, attempts=attempt)
+            if result.ok or result.conflict or result.gone:
+                return result
+            return self.__failed(result)
+
+    def __wait(self, method: str, endpoint: str, attempt: int) -> None:
+        delay = self.retry_policy.delay(attempt)
+        with self.__stats_lock:
+            self.retries += 1
+        self.metrics.record_retry(method, endpoint, delay)
+        time.sleep(delay)
+
+    def __failed(self, result: RequestResult) -> RequestResult:
+        with self.__stats_lock:
+            self.failures[str(result.status or (result.error or "").split(":")[0])] += 1
+        self.__logger.error(
+            f"Request failed: {result}",
+            extra=request_fields(
+                self.metrics.current_phase,
+                result.method,
+                result.endpoint,
+                result.status,
+            ),
         )
-        log = f"POST url: {endpoint}   {str(response.status_code)}"
-        self.__logger.info(log)
-        response.raise_for_status()
+        return result
+
+    def __send(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        response = self.__request(method, endpoint, **kwargs)
+        if response.status_code == 401 and self.token_manager is not None:
+            self.token_manager.invalidate(response.request.headers["Authorization"])
+            response = self.__request(method, endpoint, **kwargs)
         return response
 
-    @delay(delay_ms=10)
-    @handle_request_errors
-    def put(self, endpoint: str, data: dict = None) -> dict:
-        response = requests.put(
-            f"{self.host}{endpoint}", headers=self.headers, json=data
+    def __request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        headers = self.headers
+        if self.token_manager is not None:
+            headers = {**headers, "Authorization": self.token_manager.authorization()}
+        waited = self.rate_limiter.acquire()
+        if self.request_slots is not None:
+            waited += self.request_slots.acquire()
+        self.metrics.record_throttle(method, endpoint, waited)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method,
+                f"{self.host}{endpoint}",
+                headers=headers,
+                timeout=self.timeout,
+                **kwargs,
+            )
+        except requests.RequestException:
+            self.metrics.record(method, endpoint, None, time.perf_counter() - started)
+            raise
+        finally:
+            if self.request_slots is not None:
+                self.request_slots.release()
+        elapsed = time.perf_counter() - started
+        self.metrics.record(
+            method,
+            endpoint,
+            response.status_code,
+            elapsed,
+            len(response.request.body or b""),
+            len(response.content),
         )
-        log = f"PUT url: {endpoint}   {str(response.status_code)}"
-        self.__logger.info(log)
-        response.raise_for_status()
+        self.rate_limiter.observe(
+            response.status_code, response.headers.get("Retry-After")
+        )
+        if self.__logger.isEnabledFor(logging.INFO):
+            self.__logger.info(
+                "%s url: %s   %s",
+                method,
+                endpoint,
+                response.status_code,
+                extra=request_fields(
+                    self.metrics.current_phase,
+                    method,
+                    endpoint,
+                    response.status_code,
+                    elapsed,
+                ),
+            )
         return response
 
-    @handle_request_errors
-    def delete(self, endpoint: str, id: str) -> dict:
-        response = requests.delete(f"{self.host}{endpoint+id}", headers=self.headers)
+    def get(self, endpoint: str, params: dict | None = None) -> RequestResult:
+        return self.__call("GET", endpoint, params=params)
+
+    def post(self, endpoint: str, data: dict | list) -> RequestResult:
+        return self.__call("POST", endpoint, json=data)
+
+    def put(self, endpoint: str, data: dict | None = None) -> RequestResult:
+        return self.__call("PUT", endpoint, json=data)
+
+    def delete(self, endpoint: str, id: str, data: list | None = None) -> RequestResult:
+        return self.__call("DELETE", endpoint + id, json=data)
+
+    def counts(self) -> RequestCounts:
+        with self.__stats_lock:
+            return RequestCounts(
+                Counter(self.failures),
+                self.retries,
+                self.circuit_breaker.opened,
+                self.rate_limiter.requests,
+                self.rate_limiter.throttled_time,
+                self.rate_limiter.backoffs,
+            )
+
+    def add_counts(self, counts: RequestCounts) -> None:
+        with self.__stats_lock:
+            self.failures.update(counts.failures)
+            self.retries += counts.retries
+            self.circuit_breaker.opened += counts.circuit_opened
+        self.rate_limiter.add_usage(counts.requests, counts.throttled, counts.backoffs)
+
+    def failure_summary(self) -> str:
+        failures = ", ".join(f"{key}: {count}" for key, count in self.failures.items())
+        return (
+            f"Failed requests: {sum(self.failures.values())}"
+            + (f" ({failures})" if failures else "")
+            + f", retries: {self.retries}, circuit opened: {self.circuit_breaker.opened}"
+        )
+
+    def paginate(
+        self,
+        endpoint: str,
+        params: dict | None = None,
+        page_size: int | None = None,
+        prefetch: bool | None = None,
+    ) -> Iterator[dict]:
+        page_size = page_size or self.page_size
+        prefetch = self.prefetch if prefetch is None else prefetch
+        params = {"briefRepresentation": "true", **(params or {}), "max": page_size}
+
+        def fetch(first: int) -> list:
+            result = self.get(endpoint, params={**params, "first": first})
+            page = result.raise_for_error().data
+            if not isinstance(page, list):
+                self.__logger.error(f"Paginate: no page at first={first} of {endpoint}")
+                return []
+            return page
+
+        if not prefetch:
+            first = 0
+            while True:
+                page = fetch(first)
+                yield from page
+                if len(page) < page_size:
+                    return
+                first += page_size
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            first = 0
+            next_page = executor.submit(fetch, first)
+            while True:
+                page = next_page.result()
+                first += page_size
+                if len(page) == page_size:
+                    next_page = executor.submit(fetch, first)
+                yield from page
+                if len(page) < page_size:
+                    return
@@ -0,0 +1,123 @@
+import atexit
+import json
+import logging
+import queue
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator
+from metrics import endpoint_template
+
+CORRELATION_FIELDS = ("phase", "object", "method", "endpoint", "status", "duration")
+TEXT_FORMAT = "%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s"
+
+_context: ContextVar[dict] = ContextVar("log_context", default={})
+_listener: QueueListener | None = None
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def request_fields(
+    phase: str,
+    method: str,
+    endpoint: str,
+    status: int | None,
+    duration: float | None = None,
+) -> dict:
+    return {
+        "phase": phase,
+        "method": method,
+        "endpoint": endpoint_template(endpoint),
+        "status": status,
+        "duration": round(duration * 1000, 1) if duration is not None else None,
+        # Only successful request lines are subject to LOG_SAMPLE.
+        "sampled": status is not None and status < 400,
+    }
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float = 1.0) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+class CorrelationFormatter(logging.Formatter):
+    def __init__(self, json_lines: bool = False) -> None:
+        super().__init__(TEXT_FORMAT)
+        self.json_lines = json_lines
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            key: getattr(record, key)
+            for key in CORRELATION_FIELDS
+            if getattr(record, key, None) is not None
+        }
+        if not self.json_lines:
+            text = super().format(record)
+            if fields:
+                text += " " + " ".join(
+                    f"{key}={value}" for key, value in fields.items()
+                )
+            return text
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **fields,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(
+    filename: str = "logs.log",
+    level: str | int = "INFO",
+    json_lines: bool = False,
+    sample_rate: float = 1.0,
+) -> QueueListener:
+    global _listener
+    if _listener is not None:
+        return _listener
+    file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(CorrelationFormatter(json_lines))
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
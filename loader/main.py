@@ -1,63 +1,448 @@
-import json
+import asyncio
 import argparse
+import os
+import pandas as pd
+from dataclasses import dataclass
+from typing import Iterable
 from dotenv import load_dotenv
+from async_keycloak_client import AsyncKeycloakClient
+from config import Config
+from delete_engine import DeleteFilter
+from estimator import LatencyModel, RequestEstimator, estimate_report
 from file_reader import FileHandler
+from journal import LoadJournal
 from manage_keycloak import KeycloakAdminHandler
+from metrics import Metrics
+from planner import RealmPlanner
+from rate_limiter import RequestSlots
+from realm_snapshot import RealmSnapshot
+from sharded_sync import sync_users_sharded
+from rows import GroupRow, RoleRow, UserRow
+from sheet_pipeline import prepare_groups, prepare_roles, prepare_users
+from sync_engine import AsyncSyncEngine
 
 
-def create_roles(file_handler: FileHandler, keycloak_handler: KeycloakAdminHandler):
-    roles = file_handler.get_fields("Role", "Role description")
-    keycloak_handler.handle_roles(roles, "Role", "Role description")
+@dataclass
+class RunResult:
+    metrics: Metrics
+    failed_requests: int = 0
+    failed_rows: int = 0
 
+    @classmethod
+    def of(cls, keycloak_handler: KeycloakAdminHandler) -> "RunResult":
+        return cls(
+            keycloak_handler.metrics,
+            sum(keycloak_handler.request_counts().failures.values()),
+            sum(keycloak_handler.failures.values()),
+        )
 
-def create_groups(file_handler: FileHandler, keycloak_handler: KeycloakAdminHandler):
 
-    file_handler.sheet = "Groups"
-    groups = file_handler.get_fields("Name", "Description", "Role")
+def get_roles(file_handler: FileHandler) -> list[RoleRow]:
+    file_handler.sheet = "Roles"
+    roles = pd.concat(file_handler.iter_frames("Role", "Role description"))
+    return list(RoleRow.from_frame(prepare_roles(roles)))
 
-    unique_json = set(json.dumps(d, sort_keys=True) for d in groups)
-    unique_groups = [json.loads(js) for js in unique_json]
-    keycloak_handler.manage_groups(unique_groups)
+
+def get_groups(file_handler: FileHandler) -> list[GroupRow]:
     file_handler.sheet = "Roles"
-    df_roles = file_handler.get_dataframe()
+    roles = pd.concat(file_handler.iter_frames("Role"))
     file_handler.sheet = "Groups"
-    file_handler.dataframe_merge(df_roles, key="Role")
-    groups = file_handler.get_fields("Name", "Description", "Role")
-    keycloak_handler.manage_groups(groups)
+    groups = pd.concat(file_handler.iter_frames("Name", "Description", "Role"))
+    return list(GroupRow.from_frame(prepare_groups(groups, roles)))
 
 
-def create_users(file_handler: FileHandler, keycloak_handler: KeycloakAdminHandler):
+def get_users(file_handler: FileHandler) -> Iterable[UserRow]:
     file_handler.sheet = "Users"
-    users = file_handler.get_fields("Username", "Name", "Group")
-    keycloak_handler.manage_users(users)
+    frames = file_handler.iter_frames("Username", "Name", "Group")
+    return (
+        user for frame in frames for user in UserRow.from_frame(prepare_users(frame))
+    )
 
 
-def main() -> None:
+def create_roles(
+    file_handler: FileHandler,
+    keycloak_handler: KeycloakAdminHandler,
+    journal: LoadJournal | None = None,
+):
+    roles = get_roles(file_handler)
+    keycloak_handler.handle_roles(roles, "Role", "Role description", journal=journal)
+
+
+def create_groups(
+    file_handler: FileHandler,
+    keycloak_handler: KeycloakAdminHandler,
+    journal: LoadJournal | None = None,
+):
+    groups = get_groups(file_handler)
+    keycloak_handler.manage_groups(groups, journal=journal)
+
+
+def create_users(
+    file_handler: FileHandler,
+    keycloak_handler: KeycloakAdminHandler,
+    journal: LoadJournal | None = None,
+    shards: int = 1,
+    resume: bool = False,
+):
+    if shards > 1:
+        file_handler.sheet = "Users"
+        frames = file_handler.iter_frames("Username", "Name", "Group")
+        for result in sync_users_sharded(keycloak_handler, frames, shards, resume):
+            print(result.summary())
+        return
+    users = get_users(file_handler)
+    keycloak_handler.manage_users(users, journal=journal)
+
+
+def plan_changes(
+    file_handler: FileHandler,
+    keycloak_handler: KeycloakAdminHandler,
+    groups: bool,
+    users: bool,
+    prune: bool,
+):
+    full_run = not groups and not users
+    planner = RealmPlanner(
+        keycloak_handler.load_snapshot(),
+        prune=prune,
+        protected=Config().protected_names(),
+    )
+    return planner.plan(
+        roles=get_roles(file_handler) if full_run else None,
+        groups=get_groups(file_handler) if full_run or groups else None,
+        users=get_users(file_handler) if full_run or users else None,
+    )
+
+
+async def load_concurrently(
+    file_handler: FileHandler,
+    concurrency: int,
+    groups: bool,
+    users: bool,
+    journal: LoadJournal | None = None,
+    metrics: Metrics | None = None,
+    request_slots: RequestSlots | None = None,
+) -> RunResult:
+    config = Config()
+    config.setup_logging()
+    full_run = not groups and not users
+    rate_limiter = config.create_rate_limiter()
+    async with AsyncKeycloakClient(
+        config.host,
+        config.realm,
+        pool_size=max(config.pool_size, concurrency),
+        timeout=config.timeout,
+        rate_limiter=rate_limiter,
+        page_size=config.page_size,
+        prefetch=config.page_prefetch,
+        token_manager=config.create_token_manager(),
+        retry_policy=config.create_retry_policy(),
+        circuit_breaker=config.create_circuit_breaker(),
+        metrics=metrics,
+        request_slots=request_slots,
+    ) as client:
+        engine = AsyncSyncEngine(client, concurrency, journal=journal)
+        try:
+            await engine.run(
+                roles=get_roles(file_handler) if full_run else None,
+                groups=get_groups(file_handler) if full_run or groups else None,
+                users=get_users(file_handler) if full_run or users else None,
+            )
+        finally:
+            print(engine.failure_summary())
+            print(rate_limiter.summary())
+    return RunResult(
+        client.metrics,
+        sum(client.failures.values()),
+        sum(engine.failures.values()),
+    )
+
+
+def estimate_load(
+    file_handler: FileHandler,
+    args: argparse.Namespace,
+    request_slots: RequestSlots | None = None,
+) -> RunResult:
+    config = Config()
+    metrics = Metrics()
+    if args.snapshot and os.path.exists(args.snapshot):
+        snapshot = RealmSnapshot.load(args.snapshot)
+    else:
+        keycloak_handler = KeycloakAdminHandler(request_slots)
+        try:
+            snapshot = keycloak_handler.load_snapshot()
+        finally:
+            keycloak_handler.close()
+        metrics = keycloak_handler.metrics
+        if args.snapshot:
+            snapshot.save(args.snapshot)
+    latency = LatencyModel(args.latency_ms / 1000)
+    if args.latency_from:
+        latency = LatencyModel.from_metrics_json(args.latency_from, latency.default)
+    estimator = RequestEstimator(config.protected_names(), snapshot, config.page_size)
+    full_run = not args.groups and not args.users
+    roles = get_roles(file_handler) if full_run else None
+    groups = get_groups(file_handler) if full_run or args.groups else None
+    users = get_users(file_handler) if full_run or args.users else None
+    if args.bulk:
+        chunk_size = args.chunk_size or config.bulk_chunk_size
+        phases = estimator.bulk(roles, groups, users, chunk_size)
+    elif args.delete:
+        phases = estimator.sync(
+            groups=groups if args.groups else None,
+            users=users if args.users else None,
+            shards=args.shards,
+        )
+        phases += estimator.delete(
+            args.concurrency or config.pool_size,
+            DeleteFilter.parse(args.name_prefix, args.attribute),
+        )
+    else:
+        concurrency = max(1, args.concurrency)
+        phases = estimator.sync(roles, groups, users, concurrency, args.shards)
+    print(estimate_report(phases, latency, config.rate_limit, config.rate_limit_max))
+    return RunResult(metrics)
+
+
+def report_metrics(metrics: Metrics, args: argparse.Namespace) -> None:
+    print(metrics.summary())
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument("-g", "--groups", help="update groups", action="store_true")
     parser.add_argument("-d", "--delete", help="delete", action="store_true")
     parser.add_argument("-u", "--users", help="update users", action="store_true")
-    args = parser.parse_args()
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        help="sync with the async engine, keeping up to N requests in flight; "
+        "with -d, delete with N parallel workers",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--plan", help="print the changes a sync would make", action="store_true"
+    )
+    parser.add_argument(
+        "--apply", help="compute the changes and apply only those", action="store_true"
+    )
+    parser.add_argument(
+        "--prune",
+        help="with --plan/--apply, also delete objects missing from the workbook",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--bulk",
+        help="load roles, groups and users through the partialImport endpoint",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--chunk-size", help="objects per partialImport request", type=int
+    )
+    parser.add_argument(
+        "--if-exists",
+        help="partialImport policy for existing objects",
+        choices=["skip", "overwrite", "fail"],
+        default="skip",
+    )
+    parser.add_argument(
+        "--name-prefix", help="with -d, only delete objects whose name has this prefix"
+    )
+    parser.add_argument(
+        "--attribute",
+        help="with -d, only delete objects carrying this KEY=VALUE attribute",
+    )
+    parser.add_argument(
+        "--restart",
+        help="with -d, ignore the checkpoint left by an interrupted delete",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--resume",
+        help="skip rows the previous run already applied with identical content",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics-json", help="write request metrics to this JSON file"
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        help="write request metrics to this Prometheus textfile-collector file",
+    )
+    parser.add_argument(
+        "--shards",
+        help="sync users in N worker processes, split by a hash of Username",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--estimate",
+        help="count the requests a run with these flags would send and project "
+        "its wall time, without changing the realm",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--snapshot",
+        help="with --estimate, read the realm state from this file, "
+        "fetching and saving it there when missing",
+    )
+    parser.add_argument(
+        "--latency-from",
+        help="with --estimate, take per-endpoint latency from a --metrics-json file",
+    )
+    parser.add_argument(
+        "--latency-ms",
+        help="with --estimate, latency for endpoints without a measurement",
+        type=float,
+        default=20.0,
+    )
+    parser.add_argument(
+        "--workbook", help="read sheets from this workbook", default="realm.xlsx"
+    )
+    for sheet in ("roles", "groups", "users"):
+        parser.add_argument(
+            f"--{sheet}-file",
+            help=f"read {sheet} from this xlsx/csv/jsonl/parquet file instead",
+        )
+    return parser
+
 
+def check_args(args: argparse.Namespace) -> None:
+    # Without -d, -c selects the async engine, which does not shard.
+    if args.concurrency > 0 and args.shards > 1 and not args.delete:
+        raise ValueError("--shards cannot be combined with -c/--concurrency")
+
+
+def run(
+    args: argparse.Namespace, request_slots: RequestSlots | None = None
+) -> RunResult:
+    check_args(args)
     load_dotenv()
-    file_handler = FileHandler("realm.xlsx")
-    keycloak_handler = KeycloakAdminHandler()
+    sources = {
+        sheet: path
+        for sheet, path in (
+            ("Roles", args.roles_file),
+            ("Groups", args.groups_file),
+            ("Users", args.users_file),
+        )
+        if path
+    }
+    file_handler = FileHandler(
+        args.workbook, sidecar=Config().sheet_cache, sources=sources
+    )
+
+    if args.estimate:
+        return estimate_load(file_handler, args, request_slots)
+
+    if args.bulk:
+        keycloak_handler = KeycloakAdminHandler(request_slots)
+        full_run = not args.groups and not args.users
+        try:
+            result = keycloak_handler.bulk_import(
+                roles=get_roles(file_handler) if full_run else None,
+                groups=(get_groups(file_handler) if full_run or args.groups else None),
+                users=get_users(file_handler) if full_run or args.users else None,
+                chunk_size=args.chunk_size,
+                if_exists=args.if_exists.upper(),
+            )
+            print(result.summary())
+        finally:
+            keycloak_handler.close()
+            report_metrics(keycloak_handler.metrics, args)
+            print(keycloak_handler.failure_summary())
+            print(keycloak_handler.rate_limiter.summary())
+        return RunResult.of(keycloak_handler)
 
-    if args.groups:
-        create_groups(file_handler, keycloak_handler)
+    if args.plan or args.apply:
+        keycloak_handler = KeycloakAdminHandler(request_slots)
+        try:
+            plan = plan_changes(
+                file_handler, keycloak_handler, args.groups, args.users, args.prune
+            )
+            if args.plan:
+                for change in plan:
+                    print(change)
+            print(plan.summary())
+            if args.apply:
+                keycloak_handler.apply_plan(plan)
+        finally:
+            keycloak_handler.close()
+            report_metrics(keycloak_handler.metrics, args)
+            print(keycloak_handler.failure_summary())
+            print(keycloak_handler.rate_limiter.summary())
+        return RunResult.of(keycloak_handler)
 
-    if args.users:
-        create_users(file_handler, keycloak_handler)
+    journal = LoadJournal(Config().state_path("load.jsonl"), resume=args.resume)
+    if args.concurrency > 0 and not args.delete:
+        metrics = Metrics()
+        try:
+            with journal:
+                return asyncio.run(
+                    load_concurrently(
+                        file_handler,
+                        args.concurrency,
+                        args.groups,
+                        args.users,
+                        journal,
+                        metrics,
+                        request_slots,
+                    )
+                )
+        finally:
+            if args.resume:
+                print(f"Skipped {journal.skipped} rows already applied")
+            report_metrics(metrics, args)
 
-    if args.delete:
-        keycloak_handler.delete_groups()
-        keycloak_handler.delete_users()
-        keycloak_handler.delete_roles()
+    keycloak_handler = KeycloakAdminHandler(request_slots)
 
-    if args.groups == False and args.users == False and args.delete == False:
-        create_roles(file_handler, keycloak_handler)
-        create_groups(file_handler, keycloak_handler)
-        create_users(file_handler, keycloak_handler)
+    try:
+        if args.groups:
+            create_groups(file_handler, keycloak_handler, journal)
+
+        if args.users:
+            create_users(
+                file_handler, keycloak_handler, journal, args.shards, args.resume
+            )
+
+        if args.delete:
+            results = keycloak_handler.delete_objects(
+                workers=args.concurrency or None,
+                delete_filter=DeleteFilter.parse(args.name_prefix, args.attribute),
+                resume=not args.restart,
+            )
+            for result in results:
+                print(result.summary())
+
+        if args.groups == False and args.users == False and args.delete == False:
+            create_roles(file_handler, keycloak_handler, journal)
+            create_groups(file_handler, keycloak_handler, journal)
+            create_users(
+                file_handler, keycloak_handler, journal, args.shards, args.resume
+            )
+    finally:
+        journal.close()
+        keycloak_handler.close()
+        if args.resume:
+            print(f"Skipped {journal.skipped} rows already applied")
+        report_metrics(keycloak_handler.metrics, args)
+        print(keycloak_handler.failure_summary())
+        print(keycloak_handler.rate_limiter.summary())
+    return RunResult.of(keycloak_handler)
+
+
+def main() -> None:
+    parser = build_parser()
+    args = parser.parse_args()
+    try:
+        check_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    run(args)
 
 
 if __name__ == "__main__":
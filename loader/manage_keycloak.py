@@ -1,305 +1,578 @@
-import requests
+import os
 import logging
-from keycloak_client import KeycloakClient
+from collections import Counter
+from itertools import groupby
+from typing import Iterable, Iterator
+from keycloak_client import KeycloakClient, RequestCounts, create_session
 from config import Config
+from delete_engine import DELETE_ORDER, DeleteEngine, DeleteFilter, DeleteResult
+from payloads import group_payload, role_payload, split_names, user_payload
+from bulk_import import (
+    IF_EXISTS_POLICIES,
+    PartialImportResult,
+    build_groups,
+    build_roles,
+    build_users,
+    chunked,
+    import_body,
+)
+from journal import LoadJournal
+from logging_setup import log_context
+from metrics import Metrics, timed_phase
+from planner import Action, Change, Kind, Plan
+from rate_limiter import AdaptiveRateLimiter, RequestSlots
+from realm_snapshot import RealmSnapshot
+from rows import SheetRow
+from token_manager import TokenManager
 
 
 class KeycloakAdminHandler:
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        request_slots: RequestSlots | None = None,
+        token_manager: TokenManager | None = None,
+        snapshot: RealmSnapshot | None = None,
+        rate_limiter: AdaptiveRateLimiter | None = None,
+    ) -> None:
         self.__config = Config()
-        self.__token_type, self.__access_token = self.__authorize_admin()
+        self.__snapshot = snapshot if snapshot is not None else RealmSnapshot()
+        self.__session = create_session(self.__config.pool_size)
+        self.rate_limiter = (
+            rate_limiter
+            if rate_limiter is not None
+            else self.__config.create_rate_limiter()
+        )
+        self.request_slots = request_slots
+        self.failures: Counter[str] = Counter()
+        self.metrics = Metrics()
+        self.token_manager = (
+            token_manager
+            if token_manager is not None
+            else self.__config.create_token_manager(self.__session)
+        )
         self.__client = KeycloakClient(
             self.__config.host,
             self.__config.realm,
-            self.__token_type,
-            self.__access_token,
-        )
-        logging.basicConfig(
-            filename="logs.log",
-            format="%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s",
-            level=logging.INFO,
+            session=self.__session,
+            timeout=self.__config.timeout,
+            rate_limiter=self.rate_limiter,
+            page_size=self.__config.page_size,
+            prefetch=self.__config.page_prefetch,
+            token_manager=self.token_manager,
+            retry_policy=self.__config.create_retry_policy(),
+            circuit_breaker=self.__config.create_circuit_breaker(),
+            metrics=self.metrics,
+            request_slots=request_slots,
         )
+        self.__config.setup_logging()
         self.__logger = logging.getLogger(__name__)
 
-    def __authorize_admin(self) -> tuple[str | None, str | None]:
-        auth_endpoint = (
-            self.__config.host + "/realms/master/protocol/openid-connect/token"
-        )
-        admin_data = {
-            "username": self.__config.admin_name,
-            "password": self.__config.admin_password,
-            "client_id": "admin-cli",
-            "grant_type": "password",
-        }
+    def close(self) -> None:
+        self.__client.close()
 
-        try:
-            response = requests.post(auth_endpoint, data=admin_data)
-            response.raise_for_status()
-            data = response.json()
-            access_token = data["access_token"]
-            token_type = data["token_type"]
-            return (token_type, access_token)
-        except requests.HTTPError as e:
-            print(f"HTTP Error: {str(e)}")
-        except requests.ConnectionError as e:
-            print(f"Connection Error: {str(e)}")
-        except requests.RequestException as e:
-            print(f"Request Exception: {str(e)}")
-        except Exception as e:
-            print(f"Exception: {str(e)}")
-        return None, None
-
-    def __get_headers(self) -> dict:
-        headers = {
-            "Authorization": f"{self.__token_type} {self.__access_token}",
-            "Content-Type": "application/json",
-        }
-        return headers
+    def request_counts(self) -> RequestCounts:
+        return self.__client.counts()
 
-    def __create_object(self, object_data: dict, endpoint: str) -> bool:
-        response = self.__client.post(endpoint, object_data)
+    def add_request_counts(self, counts: RequestCounts) -> None:
+        self.__client.add_counts(counts)
 
-    def __create_role(self, role_name: str, role_desc: str = "") -> None:
-        roles_endpoint = f"/admin/realms/{self.__config.realm}/roles"
-        data = {"name": role_name, "description": role_desc}
-        self.__create_object(data, roles_endpoint)
+    def failure_summary(self) -> str:
+        rows = ", ".join(f"{phase}: {count}" for phase, count in self.failures.items())
+        summary = self.__client.failure_summary()
+        return f"Failed rows - {rows}\n{summary}" if rows else summary
+
+    def __failed(self, phase: str, message: str) -> None:
+        self.failures[phase] += 1
+        self.__logger.error(message)
+
+    @property
+    def snapshot(self) -> RealmSnapshot:
+        return self.__snapshot
+
+    def __create_object(self, object_data: dict, endpoint: str) -> str | None:
+        result = self.__client.post(endpoint, object_data)
+        if result.conflict:
+            return None
+        location = result.raise_for_error().location
+        if location:
+            return location.rstrip("/").rsplit("/", 1)[-1]
+        return None
 
-    def manage_users(self, users_data: list[dict]) -> None:
+    @timed_phase("users")
+    def manage_users(
+        self, users_data: Iterable[dict | SheetRow], journal: LoadJournal | None = None
+    ) -> None:
         users_endpoint = f"/admin/realms/{self.__config.realm}/users"
-        users = self.__get_objects(users_endpoint)
+        self.__ensure_users()
+        self.__ensure_groups()
+        self.__ensure_memberships()
+        if journal is not None:
+            users_data = journal.pending("users", users_data)
         for user in users_data:
-            try:
-                self.__process_single_user(user, users, users_endpoint)
-            except KeyError as e:
-                self.__logger.error(f"Manage users - missing key in data: {str(e)}")
-            except ValueError as e:
-                self.__logger.error(f"Manage users - data format error: {str(e)}")
-            except Exception as e:
-                self.__logger.error(f"Manage roles: {str(e)}")
+            with log_context(phase="users", object=user.get("Username")):
+                try:
+                    self.__process_single_user(user, users_endpoint)
+                    if journal is not None:
+                        journal.record("users", user)
+                except KeyError as e:
+                    self.__failed(
+                        "users", f"Manage users - missing key in data: {str(e)}"
+                    )
+                except ValueError as e:
+                    self.__failed(
+                        "users", f"Manage users - data format error: {str(e)}"
+                    )
+                except Exception as e:
+                    self.__failed("users", f"Manage users: {str(e)}")
 
-    def __process_single_user(self, user_data: dict, users: list, users_endpoint: str):
-        existing_user = next(
-            (user for user in users if user["username"] == user_data["Username"]),
-            None,
-        )
+    def __process_single_user(self, user_data: dict | SheetRow, users_endpoint: str):
+        user_id = self.__snapshot.user_id(user_data["Username"])
 
-        try:
-            firstname, lastname = user_data["Name"].split(" ")
-        except KeyError as e:
-            self.__logger.error(f"Process user - no key 'Name': {str(e)}")
-        except Exception as e:
-            self.__logger.error(f"Process user: {str(e)}")
-
-        data = {
-            "username": user_data["Username"],
-            "firstName": firstname,
-            "lastName": lastname,
-            "enabled": True,
-            "credentials": [
-                {
-                    "type": "password",
-                    "value": "password",
-                    "temporary": False,
-                }
-            ],
-        }
-        if existing_user:
-            user_id = existing_user["id"]
+        data = user_payload(user_data["Username"], user_data["Name"])
+        if user_id:
             user_endpoint = users_endpoint + "/" + user_id
             self.__update_object(data, user_endpoint)
         else:
-            self.__create_object(data, users_endpoint)
-            self.__assign_groups_to_user(user_data, users_endpoint)
+            user_id = self.__create_object(data, users_endpoint)
+            if user_id is None:
+                user_id = self.__find_id(users_endpoint, data["username"], "username")
+            if user_id is None:
+                raise ValueError(f"User '{data['username']}' was not created")
+            self.__snapshot.add_user(data["username"], user_id)
+        self.__assign_groups_to_user(user_data, user_id)
 
-    def __assign_groups_to_user(self, user_data: dict, endpoint: str):
-        user_id = self.__get_object_id(endpoint, user_data["Username"], "username")
-        for role in user_data["Role"]:
-            group_name = f'{user_data["Group"]}-{role}'
-            self.__update_user_groups(user_id, group_name)
+    def __assign_groups_to_user(self, user_data: dict | SheetRow, user_id: str):
+        self.__update_user_groups(user_id, split_names(user_data["Group"]))
 
-    def manage_groups(self, groups_data: list[dict]) -> None:
+    @timed_phase("groups")
+    def manage_groups(
+        self, groups_data: Iterable[dict | SheetRow], journal: LoadJournal | None = None
+    ) -> None:
         groups_endpoint = f"/admin/realms/{self.__config.realm}/groups"
-        groups_list = self.__get_objects(groups_endpoint)
+        self.__ensure_groups()
+        self.__ensure_roles()
+        if journal is not None:
+            groups_data = journal.pending("groups", groups_data)
         for group_data in groups_data:
-            try:
-                self.__process_single_group(group_data, groups_endpoint, groups_list)
-            except KeyError as e:
-                self.__logger.error(f"Manage group - missing key in data: {str(e)}")
-            except ValueError as e:
-                self.__logger.error(f"Manage group - data format error: {str(e)}")
-            except Exception as e:
-                self.__logger.error(f"Manage roles: {str(e)}")
-
-    def __process_single_group(
-        self, group_data: dict, groups_endpoint: str, groups_list: list
-    ):
-        existing_group = next(
-            (group for group in groups_list if group["name"] == group_data["Name"]),
-            None,
-        )
-        data = {
-            "name": group_data["Name"],
-            "attributes": {"name": [group_data["Description"]]},
-        }
-        if existing_group:
-            group_id = existing_group["id"]
+            with log_context(phase="groups", object=group_data.get("Name")):
+                try:
+                    self.__process_single_group(group_data, groups_endpoint)
+                    if journal is not None:
+                        journal.record("groups", group_data)
+                except KeyError as e:
+                    self.__failed(
+                        "groups", f"Manage group - missing key in data: {str(e)}"
+                    )
+                except ValueError as e:
+                    self.__failed(
+                        "groups", f"Manage group - data format error: {str(e)}"
+                    )
+                except Exception as e:
+                    self.__failed("groups", f"Manage groups: {str(e)}")
+
+    def __process_single_group(self, group_data: dict | SheetRow, groups_endpoint: str):
+        group_id = self.__snapshot.group_id(group_data["Name"])
+        data = group_payload(group_data["Name"], group_data["Description"])
+        if group_id:
             group_endpoint = groups_endpoint + f"/{group_id}"
             self.__update_object(data, group_endpoint)
-            try:
-                roles = group_data["Role"].split("\n")
-                for role in roles:
-                    self.__update_assigned_roles(
-                        group_endpoint=groups_endpoint,
-                        group=data,
-                        role=role,
-                    )
-            except KeyError as e:
-                self.__logger.error(f"Process single group - no key: {str(e)}")
-            except Exception as e:
-                self.__logger.error(f"Process single group: {str(e)}")
         else:
-            self.__create_object(data, groups_endpoint)
-            try:
-                roles = group_data["Role"].split("\n")
-                for role in roles:
-                    self.__update_assigned_roles(
-                        group_endpoint=groups_endpoint,
-                        group=data,
-                        role=role,
-                    )
-            except KeyError as e:
-                self.__logger.error(f"Process single group - no key: {str(e)}")
-            except Exception as e:
-                self.__logger.error(f"Process single group: {str(e)}")
+            group_id = self.__create_object(data, groups_endpoint)
+            if group_id is None:
+                group_id = self.__find_id(groups_endpoint, data["name"], "name")
+            if group_id is None:
+                raise ValueError(f"Group '{data['name']}' was not created")
+            self.__snapshot.add_group(data["name"], group_id)
+        try:
+            roles = split_names(group_data["Role"])
+        except KeyError as e:
+            self.__logger.error(f"Process single group - no key: {str(e)}")
+            return
+        self.__update_assigned_roles(group_id=group_id, role_names=roles)
 
+    @timed_phase("roles")
     def handle_roles(
-        self, roles: list[dict], name_key: str, desc_key: str | None = None
+        self,
+        roles: Iterable[dict | SheetRow],
+        name_key: str,
+        desc_key: str | None = None,
+        journal: LoadJournal | None = None,
     ) -> None:
         roles_endpoint = f"/admin/realms/{self.__config.realm}/roles"
-        roles_list = self.__get_objects(roles_endpoint)
-        try:
-            for role in roles:
-                existed = False
-                for role in roles_list:
-                    if role["name"] == role[name_key]:
-                        existed = True
-                        break
-
-                if existed:
-                    updated_role = {
-                        "name": role["name"],
-                        "description": role.get(desc_key, ""),
-                    }
-                    role_endpoint = (
-                        f"/admin/realms/{self.__config.realm}/roles/{role['name']}"
-                    )
+        self.__ensure_roles()
+        if journal is not None:
+            roles = journal.pending("roles", roles)
+        for role in roles:
+            with log_context(phase="roles", object=role.get(name_key)):
+                try:
+                    existed = self.__snapshot.role(role[name_key]) is not None
+                    data = role_payload(role[name_key], role.get(desc_key, ""))
 
-                    self.__update_object(updated_role, role_endpoint)
-                else:
-                    data = {
-                        "name": role[name_key],
-                        "description": role.get(desc_key, ""),
-                    }
-                    self.__create_object(data, roles_endpoint)
-        except KeyError as e:
-            self.__logger.error(f"Key Error: {str(e)}")
-        except Exception as e:
-            self.__logger.error(f"Exception: {str(e)}")
+                    if existed:
+                        role_endpoint = (
+                            f"/admin/realms/{self.__config.realm}/roles/{data['name']}"
+                        )
+
+                        self.__update_object(data, role_endpoint)
+                    else:
+                        self.__create_object(data, roles_endpoint)
+                        self.__snapshot.add_role(data)
+                    if journal is not None:
+                        journal.record("roles", role)
+                except KeyError as e:
+                    self.__failed("roles", f"Key Error: {str(e)}")
+                except Exception as e:
+                    self.__failed("roles", f"Exception: {str(e)}")
 
     def delete_groups(self) -> None:
-        groups_endpoint = f"/admin/realms/{self.__config.realm}/groups/"
-        groups_list = self.__get_objects(groups_endpoint)
-        for group in groups_list:
-            self.__delete_object(groups_endpoint, group["id"])
+        self.delete_objects(("groups",))
 
     def delete_users(self) -> None:
-        users_endpoint = f"/admin/realms/{self.__config.realm}/users/"
-        users = self.__get_objects(users_endpoint)
-        for user in users:
-            self.__delete_object(users_endpoint, user["id"])
+        self.delete_objects(("users",))
 
     def delete_roles(self) -> None:
-        roles_endpoint = f"/admin/realms/{self.__config.realm}/roles"
-        roles_list = self.__get_objects(roles_endpoint)
-        for role in roles_list:
-            roles_endpoint = f"/admin/realms/{self.__config.realm}/roles-by-id/"
-            self.__delete_object(roles_endpoint, role["id"])
+        self.delete_objects(("roles",))
 
-    def __delete_object(self, endpoint: str, object_id: str) -> None:
-        response = self.__client.delete(endpoint, object_id)
+    @timed_phase("delete")
+    def delete_objects(
+        self,
+        kinds: tuple[str, ...] = DELETE_ORDER,
+        workers: int | None = None,
+        delete_filter: DeleteFilter | None = None,
+        resume: bool = True,
+    ) -> list[DeleteResult]:
+        checkpoint = self.__config.state_path("delete.jsonl")
+        if not resume and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        engine = DeleteEngine(
+            self.__client,
+            self.__config.realm,
+            workers=workers or self.__config.pool_size,
+            delete_filter=delete_filter,
+            checkpoint=checkpoint,
+            protected=self.__config.protected_names(),
+        )
+        results = engine.run(kinds)
+        remove = {
+            "users": self.__snapshot.remove_user,
+            "groups": self.__snapshot.remove_group,
+            "roles": self.__snapshot.remove_role,
+        }
+        for result in results:
+            for object_id in result.deleted_ids:
+                remove[result.kind](object_id)
+        return results
 
-    def __update_object(self, object_data: dict, endpoint: str) -> None:
-        response = self.__client.put(endpoint, object_data)
+    @timed_phase("snapshot")
+    def load_snapshot(self) -> RealmSnapshot:
+        realm_endpoint = f"/admin/realms/{self.__config.realm}"
+        full = {"briefRepresentation": "false"}
+        self.__snapshot.load_roles(
+            self.__client.paginate(f"{realm_endpoint}/roles", params=full)
+        )
+        self.__snapshot.load_groups(
+            self.__client.paginate(f"{realm_endpoint}/groups", params=full),
+            keep_details=True,
+        )
+        self.__snapshot.load_users(
+            self.__client.paginate(f"{realm_endpoint}/users"), keep_details=True
+        )
+        for group_id in (self.__snapshot.groups or {}).values():
+            self.__get_assigned_roles(group_id)
+        self.__snapshot.load_memberships(self.__iter_memberships())
+        return self.__snapshot
 
-    def __get_assigned_roles(self, group_id: str) -> list:
-        group_endpoint = f"/admin/realms/{self.__config.realm}/groups/{group_id}"
-        response = self.__client.get(group_endpoint)
-        return response.get("realmRoles", [])
+    @timed_phase("snapshot")
+    def user_snapshot(self) -> RealmSnapshot:
+        self.__ensure_groups()
+        self.__ensure_users()
+        self.__ensure_memberships()
+        return self.__snapshot
 
-    def __get_assigned_groups_users(self, user_id: str) -> list:
-        group_endpoint = f"/admin/realms/{self.__config.realm}/users/{user_id}/groups"
-        response = self.__client.get(group_endpoint)
-        return response
+    @timed_phase("bulk")
+    def bulk_import(
+        self,
+        roles: Iterable[dict | SheetRow] | None = None,
+        groups: Iterable[dict | SheetRow] | None = None,
+        users: Iterable[dict | SheetRow] | None = None,
+        chunk_size: int | None = None,
+        if_exists: str = "SKIP",
+    ) -> PartialImportResult:
+        if if_exists not in IF_EXISTS_POLICIES:
+            raise ValueError(f"ifResourceExists must be one of {IF_EXISTS_POLICIES}")
+        import_endpoint = f"/admin/realms/{self.__config.realm}/partialImport"
+        chunk_size = chunk_size or self.__config.bulk_chunk_size
+        result = PartialImportResult()
+        sections = [
+            ("roles", build_roles(roles) if roles is not None else []),
+            ("groups", build_groups(groups) if groups is not None else []),
+            ("users", build_users(users) if users is not None else []),
+        ]
+        for section, representations in sections:
+            for chunk in chunked(representations, chunk_size):
+                body = import_body(section, chunk, if_exists)
+                response = self.__client.post(import_endpoint, body)
+                if not response.ok:
+                    self.__logger.error(
+                        f"Bulk import - {section} chunk of {len(chunk)} failed"
+                    )
+                    result.failed += len(chunk)
+                    continue
+                result.add(response.data)
+        for imported in result.imported:
+            name, object_id = imported["resourceName"], imported["id"]
+            resource_type = imported.get("resourceType")
+            if resource_type == "GROUP" and self.__snapshot.groups is not None:
+                self.__snapshot.add_group(name, object_id, new=False)
+            elif resource_type == "USER" and self.__snapshot.users is not None:
+                self.__snapshot.add_user(name, object_id, new=False)
+        return result
 
-    def __update_assigned_roles(
-        self, group_endpoint: str, group: dict, role: str
-    ) -> None:
-        group_id = self.__get_object_id(group_endpoint, group["name"], "name")
-        assigned_list = self.__get_assigned_roles(group_id)
-        is_assigned = role in assigned_list
-        if not is_assigned:
-            role_endpoint = f"/admin/realms/{self.__config.realm}/roles/{role}"
-            role_response = self.__client.get(role_endpoint)
-            assign_endpoint = f"/admin/realms/{self.__config.realm}/groups/{group_id}/role-mappings/realm"
+    @timed_phase("apply")
+    def apply_plan(self, plan: Plan) -> None:
+        batches = groupby(
+            plan, key=lambda change: (change.kind, change.action, change.name)
+        )
+        for _, batch in batches:
+            changes = list(batch)
             try:
-                data = [{"id": role_response["id"], "name": role_response["name"]}]
+                self.__apply_changes(changes)
+            except KeyError as e:
+                self.__failed(
+                    changes[0].kind.value,
+                    f"Apply plan - missing key: {str(e)} ({changes[0]})",
+                )
+            except ValueError as e:
+                self.__failed(
+                    changes[0].kind.value, f"Apply plan - {str(e)} ({changes[0]})"
+                )
             except Exception as e:
-                self.__logger.error(f"Update assigned roles: {str(e)}")
-                response = self.__client.post(assign_endpoint, data=data)
+                self.__failed(
+                    changes[0].kind.value, f"Apply plan: {str(e)} ({changes[0]})"
+                )
 
-    def __update_user_groups(self, user_id: str, group_name: str) -> None:
-        assigned_list = self.__get_assigned_groups_users(user_id)
-        try:
-            groups_names = [group["name"] for group in assigned_list]
-        except KeyError as e:
-            self.__logger.error(
-                f"Update user's groups - there is no key 'name': {str(e)}"
-            )
-        except Exception as e:
-            self.__logger.error(f"Update user's groups: {str(e)}")
+    def __apply_changes(self, changes: list[Change]) -> None:
+        first = changes[0]
+        targets = [change.target for change in changes if change.target is not None]
+        realm_endpoint = f"/admin/realms/{self.__config.realm}"
+        if first.kind is Kind.GROUP_ROLE:
+            group_id = self.__snapshot.group_id(first.name)
+            if group_id is None:
+                raise ValueError(f"unknown group '{first.name}'")
+            if first.action is Action.ADD:
+                self.__update_assigned_roles(group_id, targets)
+                return
+            data = []
+            for role_name in targets:
+                role = self.__get_role(role_name)
+                if role is not None:
+                    data.append({"id": role["id"], "name": role["name"]})
+            if not data:
+                return
+            mapping_endpoint = f"{realm_endpoint}/groups/{group_id}/role-mappings/realm"
+            if self.__client.delete(mapping_endpoint, "", data=data).raise_for_error():
+                self.__snapshot.group_roles[group_id].difference_update(
+                    role["name"] for role in data
+                )
+        elif first.kind is Kind.USER_GROUP:
+            user_id = self.__snapshot.user_id(first.name)
+            if user_id is None:
+                raise ValueError(f"unknown user '{first.name}'")
+            if first.action is Action.ADD:
+                self.__update_user_groups(user_id, targets)
+                return
+            membership_endpoint = f"{realm_endpoint}/users/{user_id}/groups/"
+            for group_name in targets:
+                group_id = self.__snapshot.group_id(group_name)
+                if group_id is None:
+                    raise ValueError(f"unknown group '{group_name}'")
+                self.__delete_object(membership_endpoint, group_id)
+                self.__snapshot.user_groups[user_id].discard(group_name)
+        else:
+            for change in changes:
+                self.__apply_change(change)
 
-        is_assigned = group_name in groups_names
-        if not is_assigned:
+    def __apply_change(self, change: Change) -> None:
+        if change.action is Action.DELETE:
+            self.__apply_delete(change)
+            return
+        if change.payload is None:
+            raise ValueError(f"no payload to {change.action.value}")
+        payload = change.payload
+        realm_endpoint = f"/admin/realms/{self.__config.realm}"
+        if change.kind is Kind.ROLE:
+            if change.action is Action.CREATE:
+                self.__create_object(payload, f"{realm_endpoint}/roles")
+                self.__snapshot.add_role(payload)
+            elif change.action is Action.UPDATE:
+                role_endpoint = f"{realm_endpoint}/roles/{change.name}"
+                self.__update_object(payload, role_endpoint)
+        elif change.kind is Kind.GROUP:
+            groups_endpoint = f"{realm_endpoint}/groups"
+            if change.action is Action.CREATE:
+                group_id = self.__create_object(payload, groups_endpoint)
+                if group_id is None:
+                    group_id = self.__find_id(groups_endpoint, change.name, "name")
+                if group_id is None:
+                    raise ValueError(f"Group '{change.name}' was not created")
+                self.__snapshot.add_group(change.name, group_id)
+            elif change.action is Action.UPDATE:
+                group_id = self.__snapshot.group_id(change.name)
+                if group_id is None:
+                    raise ValueError(f"unknown group '{change.name}'")
+                self.__update_object(payload, f"{groups_endpoint}/{group_id}")
+        elif change.kind is Kind.USER:
+            users_endpoint = f"{realm_endpoint}/users"
+            if change.action is Action.CREATE:
+                user_id = self.__create_object(payload, users_endpoint)
+                if user_id is None:
+                    user_id = self.__find_id(users_endpoint, change.name, "username")
+                if user_id is None:
+                    raise ValueError(f"User '{change.name}' was not created")
+                self.__snapshot.add_user(change.name, user_id)
+            elif change.action is Action.UPDATE:
+                user_id = self.__snapshot.user_id(change.name)
+                if user_id is None:
+                    raise ValueError(f"unknown user '{change.name}'")
+                self.__update_object(payload, f"{users_endpoint}/{user_id}")
+
+    def __apply_delete(self, change: Change) -> None:
+        realm_endpoint = f"/admin/realms/{self.__config.realm}"
+        if change.kind is Kind.ROLE:
+            role = self.__snapshot.role(change.name)
+            if role is None or "id" not in role:
+                raise ValueError(f"unknown role '{change.name}'")
+            self.__delete_object(f"{realm_endpoint}/roles-by-id/", role["id"])
+            self.__snapshot.remove_role(role["id"])
+        elif change.kind is Kind.GROUP:
+            group_id = self.__snapshot.group_id(change.name)
+            if group_id is None:
+                raise ValueError(f"unknown group '{change.name}'")
+            self.__delete_object(f"{realm_endpoint}/groups/", group_id)
+            self.__snapshot.remove_group(group_id)
+        elif change.kind is Kind.USER:
+            user_id = self.__snapshot.user_id(change.name)
+            if user_id is None:
+                raise ValueError(f"unknown user '{change.name}'")
+            self.__delete_object(f"{realm_endpoint}/users/", user_id)
+            self.__snapshot.remove_user(user_id)
+
+    def __delete_object(self, endpoint: str, object_id: str) -> None:
+        result = self.__client.delete(endpoint, object_id)
+        if not result.gone:
+            result.raise_for_error()
+
+    def __update_object(self, object_data: dict, endpoint: str) -> None:
+        self.__client.put(endpoint, object_data).raise_for_error()
+
+    def __ensure_roles(self) -> None:
+        if self.__snapshot.roles is None:
+            roles_endpoint = f"/admin/realms/{self.__config.realm}/roles"
+            self.__snapshot.load_roles(self.__client.paginate(roles_endpoint))
+
+    def __ensure_groups(self) -> None:
+        if self.__snapshot.groups is None:
             groups_endpoint = f"/admin/realms/{self.__config.realm}/groups"
-            groups_data = self.__client.get(
-                groups_endpoint, params={"search": group_name}
+            self.__snapshot.load_groups(self.__client.paginate(groups_endpoint))
+
+    def __ensure_users(self) -> None:
+        if self.__snapshot.users is None:
+            users_endpoint = f"/admin/realms/{self.__config.realm}/users"
+            self.__snapshot.load_users(self.__client.paginate(users_endpoint))
+
+    def __ensure_memberships(self) -> None:
+        snapshot = self.__snapshot
+        # Listing members costs a request per group instead of one per user.
+        if not snapshot.memberships_loaded and len(snapshot.users or {}) > len(
+            snapshot.groups or {}
+        ):
+            snapshot.load_memberships(self.__iter_memberships())
+
+    def __iter_memberships(self) -> Iterator[tuple[str, str]]:
+        groups_endpoint = f"/admin/realms/{self.__config.realm}/groups"
+        for group_name, group_id in list((self.__snapshot.groups or {}).items()):
+            members_endpoint = f"{groups_endpoint}/{group_id}/members"
+            for member in self.__client.paginate(members_endpoint):
+                yield member["id"], group_name
+
+    def __get_role(self, role_name: str) -> dict | None:
+        role = self.__snapshot.role(role_name)
+        if role is not None and "id" not in role:
+            role_endpoint = f"/admin/realms/{self.__config.realm}/roles/{role_name}"
+            role = self.__client.get(role_endpoint).raise_for_error().data
+            if role is not None:
+                self.__snapshot.add_role(role)
+        return role
+
+    def __get_assigned_roles(self, group_id: str) -> set[str]:
+        if group_id not in self.__snapshot.group_roles:
+            mapping_endpoint = f"/admin/realms/{self.__config.realm}/groups/{group_id}/role-mappings/realm"
+            roles = self.__get_objects(mapping_endpoint)
+            self.__snapshot.set_group_roles(group_id, [role["name"] for role in roles])
+        return self.__snapshot.group_roles[group_id]
+
+    def __get_assigned_groups_users(self, user_id: str) -> set[str]:
+        if user_id not in self.__snapshot.user_groups:
+            group_endpoint = (
+                f"/admin/realms/{self.__config.realm}/users/{user_id}/groups"
             )
-            try:
-                for data in groups_data:
-                    assign_endpoint = f"/admin/realms/{self.__config.realm}/users/{user_id}/groups/{data['id']}"
-                    response = self.__client.put(assign_endpoint)
-            except RuntimeError as e:
-                self.__logger.error(
-                    f"Update user's groups - there is no data: {str(e)}"
+            groups = self.__client.paginate(group_endpoint)
+            self.__snapshot.set_user_groups(
+                user_id, [group["name"] for group in groups]
+            )
+        return self.__snapshot.user_groups[user_id]
+
+    def __update_assigned_roles(self, group_id: str, role_names: Iterable[str]) -> None:
+        assigned = self.__get_assigned_roles(group_id)
+        missing, unknown = [], []
+        for role_name in dict.fromkeys(role_names):
+            if role_name in assigned:
+                continue
+            role = self.__get_role(role_name)
+            if role is None:
+                unknown.append(role_name)
+                continue
+            missing.append({"id": role["id"], "name": role["name"]})
+        if missing:
+            realm_endpoint = f"/admin/realms/{self.__config.realm}"
+            assign_endpoint = f"{realm_endpoint}/groups/{group_id}/role-mappings/realm"
+            if self.__client.post(assign_endpoint, data=missing).raise_for_error():
+                self.__snapshot.assign_group_roles(
+                    group_id, [role["name"] for role in missing]
                 )
-            except Exception as e:
-                self.__logger.error(f"Update user's groups: {str(e)}")
+        # Fail the row so it is not journaled and --resume retries the mapping.
+        if unknown:
+            raise ValueError(f"unknown roles: {', '.join(unknown)}")
 
-    def __get_objects(self, endpoint: str) -> list:
-        try:
-            response = self.__client.get(endpoint)
-        except Exception as e:
-            self.__logger.error(f"Get objects: {str(e)}")
+    def __update_user_groups(self, user_id: str, group_names: Iterable[str]) -> None:
+        assigned = self.__get_assigned_groups_users(user_id)
+        unknown = []
+        for group_name in dict.fromkeys(group_names):
+            if group_name in assigned:
+                continue
+            group_id = self.__snapshot.group_id(group_name)
+            if group_id is None:
+                unknown.append(group_name)
+                continue
+            assign_endpoint = (
+                f"/admin/realms/{self.__config.realm}/users/{user_id}/groups/{group_id}"
+            )
+            if self.__client.put(assign_endpoint).raise_for_error():
+                self.__snapshot.assign_user_groups(user_id, [group_name])
+        if unknown:
+            raise ValueError(f"unknown groups: {', '.join(unknown)}")
+
+    def __get_objects(self, endpoint: str, params: dict | None = None) -> list:
+        response = self.__client.get(endpoint, params=params).raise_for_error().data
+        if not isinstance(response, list):
+            self.__logger.error(f"Get objects: no list returned from {endpoint}")
+            return []
         return response
 
-    def __get_object_id(self, endpoint: str, object_name: str, key: str) -> str:
-        objects = self.__client.get(endpoint)
-        try:
-            for object in objects:
-                if object[key] == object_name:
-                    return object["id"]
-        except KeyError as e:
-            self.__logger.error(f"Response does not contain expected key: {str(e)}")
-        except Exception as e:
-            self.__logger.error(f"Get object id: {str(e)}")
+    def __find_id(self, endpoint: str, object_name: str, key: str) -> str | None:
+        params = {"exact": "true", key if key != "name" else "search": object_name}
+        for object in self.__get_objects(endpoint, params=params):
+            if object.get(key) == object_name:
+                return object["id"]
+        return None
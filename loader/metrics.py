@@ -0,0 +1,262 @@
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+PLACEHOLDERS = {
+    "realms": "{realm}",
+    "users": "{id}",
+    "groups": "{id}",
+    "roles-by-id": "{id}",
+    "roles": "{role}",
+}
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def endpoint_template(endpoint: str) -> str:
+    template, placeholder = [], None
+    for part in endpoint.split("?", 1)[0].strip("/").split("/"):
+        if placeholder:
+            template.append(placeholder)
+            placeholder = None
+            continue
+        template.append(part)
+        placeholder = PLACEHOLDERS.get(part)
+    return "/" + "/".join(template)
+
+
+def percentile(ordered: list[float], quantile: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(quantile * len(ordered)) - 1)]
+
+
+class EndpointStats:
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        self.statuses: Counter[int | str] = Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.throttled = 0.0
+        self.retry_wait = 0.0
+        self.retries = 0
+
+    def quantiles(self) -> dict[float, float]:
+        ordered = sorted(self.latencies)
+        return {quantile: percentile(ordered, quantile) for quantile in QUANTILES}
+
+    def to_dict(self) -> dict:
+        return {
+            "count": len(self.latencies),
+            "seconds": sum(self.latencies),
+            **{f"p{round(q * 100)}": value for q, value in self.quantiles().items()},
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "throttled_seconds": self.throttled,
+            "retry_wait_seconds": self.retry_wait,
+            "retries": self.retries,
+        }
+
+
+class Metrics:
+
+    def __init__(self) -> None:
+        self.endpoints: dict[tuple[str, str, str], EndpointStats] = {}
+        self.phases: dict[str, float] = {}
+        self.current_phase = "setup"
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        previous, self.current_phase = self.current_phase, name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.__lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            self.current_phase = previous
+
+    def record(
+        self,
+        method: str,
+        endpoint: str,
+        status: int | None,
+        seconds: float,
+        bytes_sent: int = 0,
+        bytes_received: int = 0,
+    ) -> None:
+        with self.__lock:
+            stats = self.__stats(method, endpoint)
+            stats.latencies.append(seconds)
+            stats.statuses[status if status is not None else "error"] += 1
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+
+    def record_throttle(self, method: str, endpoint: str, seconds: float) -> None:
+        if seconds > 0:
+            with self.__lock:
+                self.__stats(method, endpoint).throttled += seconds
+
+    def record_retry(self, method: str, endpoint: str, seconds: float) -> None:
+        with self.__lock:
+            stats = self.__stats(method, endpoint)
+            stats.retries += 1
+            stats.retry_wait += seconds
+
+    def merge(self, other: "Metrics") -> None:
+        with self.__lock:
+            for key, stats in other.endpoints.items():
+                merged = self.endpoints.get(key)
+                if merged is None:
+                    merged = self.endpoints[key] = EndpointStats()
+                merged.latencies.extend(stats.latencies)
+                merged.statuses.update(stats.statuses)
+                merged.bytes_sent += stats.bytes_sent
+                merged.bytes_received += stats.bytes_received
+                merged.throttled += stats.throttled
+                merged.retry_wait += stats.retry_wait
+                merged.retries += stats.retries
+            # Merged phases ran side by side, so the longest one is the wall time.
+            for name, elapsed in other.phases.items():
+                self.phases[name] = max(self.phases.get(name, 0.0), elapsed)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_Metrics__lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def statuses(self) -> Counter:
+        with self.__lock:
+            return sum((stats.statuses for stats in self.endpoints.values()), Counter())
+
+    def __stats(self, method: str, endpoint: str) -> EndpointStats:
+        key = (self.current_phase, method, endpoint_template(endpoint))
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = EndpointStats()
+        return stats
+
+    def summary(self) -> str:
+        header = (
+            f"{'phase':<10}{'method':<7}{'endpoint':<52}{'count':>7}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'KiB in':>9}{'KiB out':>9}"
+            f"{'wait s':>8}  statuses"
+        )
+        lines = [header]
+        for (phase, method, template), stats in sorted(self.endpoints.items()):
+            p50, p95, p99 = stats.quantiles().values()
+            statuses = " ".join(
+                f"{status}:{count}"
+                for status, count in sorted(stats.statuses.items(), key=str)
+            )
+            lines.append(
+                f"{phase:<10}{method:<7}{template:<52}{len(stats.latencies):>7}"
+                f"{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}{p99 * 1000:>9.1f}"
+                f"{stats.bytes_received / 1024:>9.1f}{stats.bytes_sent / 1024:>9.1f}"
+                f"{stats.throttled + stats.retry_wait:>8.2f}  {statuses}"
+            )
+        phases = ", ".join(
+            f"{name} {elapsed:.2f}s" for name, elapsed in self.phases.items()
+        )
+        if phases:
+            lines.append(f"Phases: {phases}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": dict(self.phases),
+            "endpoints": [
+                {
+                    "phase": phase,
+                    "method": method,
+                    "endpoint": template,
+                    **stats.to_dict(),
+                }
+                for (phase, method, template), stats in sorted(self.endpoints.items())
+            ],
+        }
+
+    def write_json(self, path: str) -> None:
+        self.__write_atomic(path, json.dumps(self.to_dict(), indent=2))
+
+    def write_prometheus(self, path: str) -> None:
+        families: dict[str, tuple[str, list[str]]] = {
+            "requests_total": ("counter", []),
+            "request_duration_seconds": ("summary", []),
+            "bytes_total": ("counter", []),
+            "wait_seconds_total": ("counter", []),
+            "retries_total": ("counter", []),
+            "phase_duration_seconds": ("gauge", []),
+        }
+
+        def sample(family: str, labels: str, value, suffix: str = "") -> None:
+            name = f"keycloak_loader_{family}{suffix}"
+            families[family][1].append(f"{name}{{{labels}}} {value}")
+
+        for (phase, method, template), stats in sorted(self.endpoints.items()):
+            labels = f'phase="{phase}",method="{method}",endpoint="{template}"'
+            for status, count in stats.statuses.items():
+                sample("requests_total", f'{labels},status="{status}"', count)
+            for quantile, value in stats.quantiles().items():
+                sample(
+                    "request_duration_seconds",
+                    f'{labels},quantile="{quantile}"',
+                    f"{value:.6f}",
+                )
+            latency_sum = f"{sum(stats.latencies):.6f}"
+            sample("request_duration_seconds", labels, latency_sum, "_sum")
+            sample("request_duration_seconds", labels, len(stats.latencies), "_count")
+            sample("bytes_total", f'{labels},direction="in"', stats.bytes_received)
+            sample("bytes_total", f'{labels},direction="out"', stats.bytes_sent)
+            throttled = f"{stats.throttled:.6f}"
+            sample("wait_seconds_total", f'{labels},reason="throttle"', throttled)
+            retry_wait = f"{stats.retry_wait:.6f}"
+            sample("wait_seconds_total", f'{labels},reason="retry"', retry_wait)
+            sample("retries_total", labels, stats.retries)
+        for phase, elapsed in self.phases.items():
+            sample("phase_duration_seconds", f'phase="{phase}"', f"{elapsed:.6f}")
+        lines = []
+        for family, (kind, samples) in families.items():
+            lines.append(f"# TYPE keycloak_loader_{family} {kind}")
+            lines.extend(samples)
+        self.__write_atomic(path, "\n".join(lines) + "\n")
+
+    def __write_atomic(self, path: str, content: str) -> None:
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(temporary, path)
+
+
+def timed_phase(name: str):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                with self.metrics.phase(name):
+                    return await func(self, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.phase(name):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
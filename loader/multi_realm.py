@@ -0,0 +1,235 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from rate_limiter import RequestSlots
+
+CREDENTIAL_ENV = {
+    "host": "HOST",
+    "admin_name": "ADMIN_NAME",
+    "admin_password": "ADMIN_PASSWORD",
+    "auth_realm": "AUTH_REALM",
+    "client_id": "CLIENT_ID",
+    "client_secret": "CLIENT_SECRET",
+    "grant_type": "GRANT_TYPE",
+}
+
+_slots: dict = {}
+
+
+def _expand(value) -> str:
+    # ${VAR} references keep passwords and secrets out of the manifest file.
+    return os.path.expandvars(str(value))
+
+
+@dataclass
+class RealmTarget:
+    realm: str
+    workbook: str
+    args: list[str] = field(default_factory=list)
+    settings: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, entry: dict, base_dir: str = ".") -> "RealmTarget":
+        if "realm" not in entry or "workbook" not in entry:
+            raise ValueError(f"Manifest entry needs 'realm' and 'workbook': {entry}")
+        settings = {
+            CREDENTIAL_ENV[key]: _expand(value)
+            for key, value in entry.items()
+            if key in CREDENTIAL_ENV
+        }
+        for key, value in entry.get("env", {}).items():
+            settings[key] = _expand(value)
+        return cls(
+            realm=entry["realm"],
+            workbook=os.path.join(base_dir, _expand(entry["workbook"])),
+            args=[_expand(arg) for arg in entry.get("args", [])],
+            settings=settings,
+        )
+
+    @property
+    def host(self) -> str:
+        return self.settings.get("HOST") or os.getenv("HOST") or "http://127.0.0.1:8080"
+
+
+@dataclass
+class RealmResult:
+    realm: str
+    host: str
+    seconds: float = 0.0
+    requests: int = 0
+    retried: int = 0
+    failed: int = 0
+    failed_rows: int = 0
+    waited: float = 0.0
+    error: str | None = None
+    output: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.failed == 0 and self.failed_rows == 0
+
+    def summary(self) -> str:
+        if self.ok:
+            outcome = "ok"
+        elif self.error:
+            outcome = self.error
+        else:
+            outcome = f"{self.failed} failed requests, {self.failed_rows} failed rows"
+        return (
+            f"{self.realm:<24}{self.seconds:>9.2f}s{self.requests:>9} requests"
+            f"{self.retried:>7} retried{self.waited:>9.2f}s host wait  {outcome}"
+        )
+
+
+def load_manifest(path: str) -> list[RealmTarget]:
+    with open(path, encoding="utf-8") as file:
+        manifest = json.load(file)
+    entries = manifest["realms"] if isinstance(manifest, dict) else manifest
+    base_dir = os.path.dirname(os.path.abspath(path))
+    targets = [RealmTarget.from_dict(entry, base_dir) for entry in entries]
+    realms = [target.realm for target in targets]
+    duplicates = {realm for realm in realms if realms.count(realm) > 1}
+    if duplicates:
+        raise ValueError(f"Realms listed more than once: {sorted(duplicates)}")
+    return targets
+
+
+def _init_worker(slots: dict) -> None:
+    global _slots
+    _slots = slots
+
+
+def load_realm(target: RealmTarget, args: list[str]) -> RealmResult:
+    import main as loader
+
+    os.environ.update(target.settings, REALM=target.realm)
+    slots = _slots.get(target.host)
+    request_slots = RequestSlots(slots) if slots is not None else None
+    result = RealmResult(target.realm, target.host)
+    output = io.StringIO()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            parsed = loader.build_parser().parse_args(
+                [*args, *target.args, "--workbook", target.workbook]
+            )
+            outcome = loader.run(parsed, request_slots)
+        # Attempts that failed before a retry succeeded are not failures.
+        statuses = outcome.metrics.statuses()
+        result.requests = sum(statuses.values())
+        result.retried = sum(
+            count
+            for status, count in statuses.items()
+            if status == "error" or (status >= 400 and status != 409)
+        )
+        result.failed = outcome.failed_requests
+        result.failed_rows = outcome.failed_rows
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {str(e)}"
+    result.seconds = time.perf_counter() - started
+    result.waited = request_slots.waited if request_slots is not None else 0.0
+    result.output = output.getvalue()
+    return result
+
+
+def load_realms(
+    targets: list[RealmTarget],
+    processes: int,
+    host_concurrency: int,
+    args: list[str] | None = None,
+    verbose: bool = False,
+) -> list[RealmResult]:
+    # Each realm gets a fresh interpreter, so sheet caches and env never leak.
+    context = multiprocessing.get_context("spawn")
+    slots = {
+        host: context.BoundedSemaphore(host_concurrency)
+        for host in {target.host for target in targets}
+    }
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(slots,),
+        max_tasks_per_child=1,
+    ) as executor:
+        futures = {
+            executor.submit(load_realm, target, args or []): target
+            for target in targets
+        }
+        for future in as_completed(futures):
+            target = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = RealmResult(
+                    target.realm, target.host, error=f"{type(e).__name__}: {str(e)}"
+                )
+            print(result.summary(), flush=True)
+            if verbose and result.output:
+                print(result.output)
+            results.append(result)
+    return sorted(results, key=lambda result: result.realm)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Load several realms in parallel from a JSON manifest"
+    )
+    parser.add_argument("manifest", help="JSON list of realm/workbook entries")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--host-concurrency",
+        type=int,
+        default=int(os.getenv("HOST_CONCURRENCY", "20")),
+        help="requests in flight per Keycloak host across all processes",
+    )
+    parser.add_argument(
+        "-v", "--verbose", help="print each realm's output", action="store_true"
+    )
+    parser.add_argument("--report", help="write per-realm results to this JSON file")
+    args, loader_args = parser.parse_known_args()
+
+    load_dotenv()
+    targets = load_manifest(args.manifest)
+    started = time.perf_counter()
+    results = load_realms(
+        targets, args.processes, args.host_concurrency, loader_args, args.verbose
+    )
+    elapsed = time.perf_counter() - started
+    print()
+    for result in results:
+        print(result.summary())
+    failed = [result.realm for result in results if not result.ok]
+    print(
+        f"Realms: {len(results)}, failed: {len(failed)}, "
+        f"requests: {sum(result.requests for result in results)}, "
+        f"wall time: {elapsed:.2f}s"
+    )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump(
+                [
+                    {
+                        key: value
+                        for key, value in result.__dict__.items()
+                        if key != "output"
+                    }
+                    for result in results
+                ],
+                file,
+                indent=2,
+            )
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
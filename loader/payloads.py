@@ -0,0 +1,50 @@
+from typing import Iterable
+from rows import SheetRow
+
+# Shared by every user payload; payloads are only serialized, never mutated.
+DEFAULT_CREDENTIALS = [{"type": "password", "value": "password", "temporary": False}]
+
+
+def role_payload(name: str, description: str | None = "") -> dict:
+    return {"name": name, "description": description or ""}
+
+
+def group_payload(name: str, description: str) -> dict:
+    return {"name": name, "attributes": {"name": [description]}}
+
+
+def user_payload(username: str, full_name: str) -> dict:
+    firstname, _, lastname = str(full_name).partition(" ")
+    return {
+        "username": username,
+        "firstName": firstname,
+        "lastName": lastname,
+        "enabled": True,
+        "credentials": DEFAULT_CREDENTIALS,
+    }
+
+
+def split_names(value) -> list[str]:
+    if isinstance(value, (list, tuple, set)):
+        return [str(item) for item in value if item]
+    return [name for name in str(value).split("\n") if name]
+
+
+def aggregate_groups(
+    groups: Iterable[dict | SheetRow],
+) -> dict[str, tuple[dict | SheetRow, set[str]]]:
+    aggregated: dict[str, tuple[dict | SheetRow, set[str]]] = {}
+    for group in groups:
+        _, role_names = aggregated.setdefault(group["Name"], (group, set()))
+        role_names.update(split_names(group.get("Role", "")))
+    return aggregated
+
+
+def aggregate_users(
+    users: Iterable[dict | SheetRow],
+) -> dict[str, tuple[dict | SheetRow, set[str]]]:
+    aggregated: dict[str, tuple[dict | SheetRow, set[str]]] = {}
+    for user in users:
+        _, group_names = aggregated.setdefault(user["Username"], (user, set()))
+        group_names.update(split_names(user.get("Group", "")))
+    return aggregated
@@ -0,0 +1,199 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Iterable, Iterator
+from payloads import (
+    aggregate_groups,
+    aggregate_users,
+    group_payload,
+    role_payload,
+    user_payload,
+)
+from realm_snapshot import RealmSnapshot
+from rows import SheetRow
+
+
+class Action(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    ADD = "add"
+    REMOVE = "remove"
+
+
+class Kind(str, Enum):
+    ROLE = "role"
+    GROUP = "group"
+    USER = "user"
+    GROUP_ROLE = "group-role"
+    USER_GROUP = "user-group"
+
+
+@dataclass(frozen=True)
+class Change:
+    action: Action
+    kind: Kind
+    name: str
+    target: str | None = None
+    payload: dict | None = field(default=None, compare=False, repr=False)
+
+    def __str__(self) -> str:
+        if self.target is None:
+            return f"{self.action.value:<7}{self.kind.value:<11}{self.name}"
+        return (
+            f"{self.action.value:<7}{self.kind.value:<11}{self.name} -> {self.target}"
+        )
+
+
+@dataclass
+class Plan:
+    changes: list[Change] = field(default_factory=list)
+    unchanged: Counter = field(default_factory=Counter)
+
+    def __iter__(self) -> Iterator[Change]:
+        return iter(self.changes)
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+    def add(self, action: Action, kind: Kind, name: str, **kwargs) -> None:
+        self.changes.append(Change(action, kind, name, **kwargs))
+
+    def counts(self) -> Counter:
+        return Counter((change.kind, change.action) for change in self.changes)
+
+    def summary(self) -> str:
+        lines = [
+            f"{kind.value:<11}{action.value:<7}{count}"
+            for (kind, action), count in sorted(self.counts().items())
+        ]
+        lines += [
+            f"{kind.value:<11}{'same':<7}{count}"
+            for kind, count in sorted(self.unchanged.items())
+        ]
+        lines.append(f"Total changes: {len(self)}")
+        return "\n".join(lines)
+
+
+def _differs(desired: dict, current: dict) -> bool:
+    for key, value in desired.items():
+        if key == "credentials":
+            continue
+        existing = current.get(key)
+        if isinstance(value, dict):
+            if _differs(value, existing or {}):
+                return True
+        elif existing != value and (existing or value):
+            return True
+    return False
+
+
+class RealmPlanner:
+
+    def __init__(
+        self,
+        snapshot: RealmSnapshot,
+        prune: bool = False,
+        protected: dict[str, set[str]] | None = None,
+    ) -> None:
+        self.__snapshot = snapshot
+        self.__prune = prune
+        self.__protected = protected or {}
+
+    def plan(
+        self,
+        roles: Iterable[dict | SheetRow] | None = None,
+        groups: Iterable[dict | SheetRow] | None = None,
+        users: Iterable[dict | SheetRow] | None = None,
+    ) -> Plan:
+        plan = Plan()
+        desired_roles = self.__desired_roles(roles) if roles is not None else None
+        desired_groups = aggregate_groups(groups) if groups is not None else None
+        desired_users = aggregate_users(users) if users is not None else None
+
+        if desired_roles is not None:
+            self.__plan_roles(plan, desired_roles)
+        if desired_groups is not None:
+            self.__plan_groups(plan, desired_groups)
+        if desired_users is not None:
+            self.__plan_users(plan, desired_users)
+
+        if self.__prune:
+            if desired_users is not None:
+                for username in self.__prunable("users", desired_users):
+                    plan.add(Action.DELETE, Kind.USER, username)
+            if desired_groups is not None:
+                for name in self.__prunable("groups", desired_groups):
+                    plan.add(Action.DELETE, Kind.GROUP, name)
+            if desired_roles is not None:
+                for name in self.__prunable("roles", desired_roles):
+                    plan.add(Action.DELETE, Kind.ROLE, name)
+        return plan
+
+    def __prunable(self, kind: str, desired: dict) -> list[str]:
+        existing = getattr(self.__snapshot, kind) or {}
+        protected = self.__protected.get(kind, set())
+        return sorted(set(existing) - set(desired) - protected)
+
+    def __desired_roles(self, roles: Iterable[dict | SheetRow]) -> dict[str, dict]:
+        return {
+            role["Role"]: role_payload(role["Role"], role.get("Role description", ""))
+            for role in roles
+        }
+
+    def __plan_roles(self, plan: Plan, desired: dict[str, dict]) -> None:
+        for name, payload in desired.items():
+            current = self.__snapshot.role(name)
+            if current is None:
+                plan.add(Action.CREATE, Kind.ROLE, name, payload=payload)
+            elif _differs(payload, current):
+                plan.add(Action.UPDATE, Kind.ROLE, name, payload=payload)
+            else:
+                plan.unchanged[Kind.ROLE] += 1
+
+    def __plan_groups(
+        self, plan: Plan, desired: dict[str, tuple[dict | SheetRow, set[str]]]
+    ) -> None:
+        mappings = []
+        for name, (group, role_names) in desired.items():
+            payload = group_payload(group["Name"], group["Description"])
+            group_id = self.__snapshot.group_id(name)
+            if group_id is None:
+                plan.add(Action.CREATE, Kind.GROUP, name, payload=payload)
+                current_roles: set[str] = set()
+            else:
+                current = self.__snapshot.details.get(group_id, {})
+                if _differs(payload, current):
+                    plan.add(Action.UPDATE, Kind.GROUP, name, payload=payload)
+                else:
+                    plan.unchanged[Kind.GROUP] += 1
+                current_roles = self.__snapshot.group_roles.get(group_id, set())
+            for role in sorted(role_names - current_roles):
+                mappings.append(Change(Action.ADD, Kind.GROUP_ROLE, name, role))
+            for role in sorted(current_roles - role_names):
+                mappings.append(Change(Action.REMOVE, Kind.GROUP_ROLE, name, role))
+        plan.changes.extend(mappings)
+
+    def __plan_users(
+        self, plan: Plan, desired: dict[str, tuple[dict | SheetRow, set[str]]]
+    ) -> None:
+        mappings = []
+        for username, (user, group_names) in desired.items():
+            payload = user_payload(user["Username"], user["Name"])
+            user_id = self.__snapshot.user_id(username)
+            if user_id is None:
+                plan.add(Action.CREATE, Kind.USER, username, payload=payload)
+                current_groups: set[str] = set()
+            else:
+                current = self.__snapshot.details.get(user_id, {})
+                if _differs(payload, current):
+                    update = {k: v for k, v in payload.items() if k != "credentials"}
+                    plan.add(Action.UPDATE, Kind.USER, username, payload=update)
+                else:
+                    plan.unchanged[Kind.USER] += 1
+                current_groups = self.__snapshot.user_groups.get(user_id, set())
+            for group in sorted(group_names - current_groups):
+                mappings.append(Change(Action.ADD, Kind.USER_GROUP, username, group))
+            for group in sorted(current_groups - group_names):
+                mappings.append(Change(Action.REMOVE, Kind.USER_GROUP, username, group))
+        plan.changes.extend(mappings)
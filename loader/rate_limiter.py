@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveRateLimiter:
+    def __init__(
+        self,
+        rate: float = 100.0,
+        min_rate: float = 1.0,
+        max_rate: float = 1000.0,
+        burst: float | None = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+    ) -> None:
+        if not 0 < min_rate <= rate <= max_rate:
+            raise ValueError(
+                "Rate limits must satisfy 0 < min_rate <= rate <= max_rate."
+            )
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst if burst is not None else max(1.0, rate / 10)
+        self.increase = increase
+        self.decrease = decrease
+        self.__lock = threading.Lock()
+        self.__tokens = self.burst
+        self.__updated = time.monotonic()
+        self.__first_request: float | None = None
+        self.requests = 0
+        self.throttled_time = 0.0
+        self.backoffs = 0
+
+    def acquire(self) -> float:
+        wait = self.__reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        wait = self.__reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def observe(self, status: int, retry_after: str | None = None) -> None:
+        with self.__lock:
+            if status in THROTTLE_STATUSES:
+                self.backoffs += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.__tokens = min(self.__tokens, 0.0)
+                pause = parse_retry_after(retry_after)
+                if pause:
+                    self.__updated = max(self.__updated, time.monotonic() + pause)
+            elif status < 500:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def __reserve(self) -> float:
+        with self.__lock:
+            now = time.monotonic()
+            if now > self.__updated:
+                elapsed = now - self.__updated
+                self.__tokens = min(self.burst, self.__tokens + elapsed * self.rate)
+                self.__updated = now
+            self.__tokens -= 1
+            # __updated lies in the future while a Retry-After pause is active
+            wait = max(0.0, self.__updated - now) + max(0.0, -self.__tokens / self.rate)
+            self.requests += 1
+            self.throttled_time += wait
+            if self.__first_request is None:
+                self.__first_request = now
+            return wait
+
+    def add_usage(self, requests: int, throttled: float, backoffs: int) -> None:
+        with self.__lock:
+            self.requests += requests
+            self.throttled_time += throttled
+            self.backoffs += backoffs
+
+    def achieved_rate(self) -> float:
+        if self.__first_request is None:
+            return 0.0
+        elapsed = time.monotonic() - self.__first_request
+        return self.requests / elapsed if elapsed > 0 else float(self.requests)
+
+    def summary(self) -> str:
+        return (
+            f"Requests: {self.requests}, achieved rate: {self.achieved_rate():.1f} req/s, "
+            f"current limit: {self.rate:.1f} req/s, backoffs: {self.backoffs}, "
+            f"throttled: {self.throttled_time:.2f}s"
+        )
+
+
+class RequestSlots:
+    def __init__(self, semaphore) -> None:
+        self.semaphore = semaphore
+        self.waited = 0.0
+
+    def acquire(self) -> float:
+        if self.semaphore.acquire(block=False):
+            return 0.0
+        started = time.monotonic()
+        self.semaphore.acquire()
+        return self.__waited(started)
+
+    async def acquire_async(self) -> float:
+        if self.semaphore.acquire(block=False):
+            return 0.0
+        started = time.monotonic()
+        # The semaphore may be shared between processes, so block off the loop.
+        await asyncio.to_thread(self.semaphore.acquire)
+        return self.__waited(started)
+
+    def release(self) -> None:
+        self.semaphore.release()
+
+    def __waited(self, started: float) -> float:
+        waited = time.monotonic() - started
+        self.waited += waited
+        return waited
@@ -0,0 +1,164 @@
+import json
+import os
+from typing import Iterable
+
+
+class RealmSnapshot:
+
+    def __init__(self) -> None:
+        self.roles: dict[str, dict] | None = None
+        self.groups: dict[str, str] | None = None
+        self.users: dict[str, str] | None = None
+        self.group_roles: dict[str, set[str]] = {}
+        self.user_groups: dict[str, set[str]] = {}
+        self.details: dict[str, dict] = {}
+        self.memberships_loaded = False
+        self.__group_names: dict[str, str] = {}
+        self.__usernames: dict[str, str] = {}
+
+    def load_roles(self, roles: Iterable[dict]) -> None:
+        self.roles = {role["name"]: role for role in roles}
+
+    def load_groups(self, groups: Iterable[dict], keep_details: bool = False) -> None:
+        self.groups = {}
+        for group in groups:
+            self.groups[group["name"]] = group["id"]
+            if keep_details:
+                self.details[group["id"]] = {
+                    "name": group["name"],
+                    "attributes": group.get("attributes", {}),
+                }
+        self.__group_names = {group_id: name for name, group_id in self.groups.items()}
+
+    def load_users(self, users: Iterable[dict], keep_details: bool = False) -> None:
+        self.users = {}
+        for user in users:
+            self.users[user["username"]] = user["id"]
+            if keep_details:
+                self.details[user["id"]] = {
+                    key: user.get(key)
+                    for key in ("username", "firstName", "lastName", "enabled")
+                }
+        self.__usernames = {user_id: name for name, user_id in self.users.items()}
+
+    def load_memberships(self, members: Iterable[tuple[str, str]]) -> None:
+        for user_id in (self.users or {}).values():
+            self.user_groups[user_id] = set()
+        for user_id, group_name in members:
+            self.user_groups.setdefault(user_id, set()).add(group_name)
+        self.memberships_loaded = True
+
+    def to_dict(self) -> dict:
+        return {
+            "roles": self.roles,
+            "groups": self.groups,
+            "users": self.users,
+            "group_roles": {
+                key: sorted(value) for key, value in self.group_roles.items()
+            },
+            "user_groups": {
+                key: sorted(value) for key, value in self.user_groups.items()
+            },
+            "memberships_loaded": self.memberships_loaded,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RealmSnapshot":
+        snapshot = cls()
+        if data.get("roles") is not None:
+            snapshot.load_roles(data["roles"].values())
+        if data.get("groups") is not None:
+            snapshot.load_groups(
+                {"name": name, "id": group_id}
+                for name, group_id in data["groups"].items()
+            )
+        if data.get("users") is not None:
+            snapshot.load_users(
+                {"username": name, "id": user_id}
+                for name, user_id in data["users"].items()
+            )
+        for group_id, role_names in data.get("group_roles", {}).items():
+            snapshot.set_group_roles(group_id, role_names)
+        for user_id, group_names in data.get("user_groups", {}).items():
+            snapshot.set_user_groups(user_id, group_names)
+        snapshot.memberships_loaded = data.get("memberships_loaded", False)
+        return snapshot
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, path: str) -> "RealmSnapshot":
+        with open(path, encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+    def role(self, name: str) -> dict | None:
+        return (self.roles or {}).get(name)
+
+    def group_id(self, name: str) -> str | None:
+        return (self.groups or {}).get(name)
+
+    def user_id(self, username: str) -> str | None:
+        return (self.users or {}).get(username)
+
+    def group_name(self, group_id: str) -> str | None:
+        return self.__group_names.get(group_id)
+
+    def add_role(self, role: dict) -> None:
+        if self.roles is None:
+            self.roles = {}
+        self.roles[role["name"]] = role
+
+    def add_group(self, name: str, group_id: str, new: bool = True) -> None:
+        if self.groups is None:
+            self.groups = {}
+        self.groups[name] = group_id
+        self.__group_names[group_id] = name
+        if new:
+            self.group_roles.setdefault(group_id, set())
+
+    def add_user(self, username: str, user_id: str, new: bool = True) -> None:
+        if self.users is None:
+            self.users = {}
+        self.users[username] = user_id
+        self.__usernames[user_id] = username
+        if new:
+            self.user_groups.setdefault(user_id, set())
+
+    def remove_role(self, role_id: str) -> None:
+        roles = self.roles or {}
+        for name, role in list(roles.items()):
+            if role.get("id") == role_id:
+                del roles[name]
+                for assigned in self.group_roles.values():
+                    assigned.discard(name)
+
+    def remove_group(self, group_id: str) -> None:
+        name = self.__group_names.pop(group_id, None)
+        if name is not None and self.groups is not None:
+            del self.groups[name]
+            for assigned in self.user_groups.values():
+                assigned.discard(name)
+        self.group_roles.pop(group_id, None)
+        self.details.pop(group_id, None)
+
+    def remove_user(self, user_id: str) -> None:
+        username = self.__usernames.pop(user_id, None)
+        if username is not None and self.users is not None:
+            del self.users[username]
+        self.user_groups.pop(user_id, None)
+        self.details.pop(user_id, None)
+
+    def set_group_roles(self, group_id: str, role_names: Iterable[str]) -> None:
+        self.group_roles[group_id] = set(role_names)
+
+    def set_user_groups(self, user_id: str, group_names: Iterable[str]) -> None:
+        self.user_groups[user_id] = set(group_names)
+
+    def assign_group_roles(self, group_id: str, role_names: Iterable[str]) -> None:
+        self.group_roles.setdefault(group_id, set()).update(role_names)
+
+    def assign_user_groups(self, user_id: str, group_names: Iterable[str]) -> None:
+        self.user_groups.setdefault(user_id, set()).update(group_names)
@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RequestError(Exception):
+    def __init__(self, result: "RequestResult") -> None:
+        super().__init__(str(result))
+        self.result = result
+
+
+@dataclass
+class RequestResult:
+    method: str
+    endpoint: str
+    status: int | None = None
+    response: Any = None
+    error: str | None = None
+    attempts: int = 1
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status is not None and self.status < 400
+
+    @property
+    def conflict(self) -> bool:
+        return self.status == 409
+
+    @property
+    def gone(self) -> bool:
+        # Deleting something that is already deleted leaves the realm as wanted.
+        return self.method == "DELETE" and self.status == 404
+
+    @cached_property
+    def data(self) -> Any:
+        if self.response is None or not self.response.content:
+            return None
+        return self.response.json()
+
+    @property
+    def location(self) -> str | None:
+        if self.response is None:
+            return None
+        return self.response.headers.get("Location")
+
+    def raise_for_error(self) -> "RequestResult":
+        if not self.ok:
+            raise RequestError(self)
+        return self
+
+    def __bool__(self) -> bool:
+        return self.ok
+
+    def __str__(self) -> str:
+        outcome = self.status if self.error is None else self.error
+        return (
+            f"{self.method} {self.endpoint}: {outcome} after {self.attempts} attempt(s)"
+        )
+
+
+class RetryPolicy:
+    def __init__(
+        self, attempts: int = 4, backoff: float = 0.5, max_backoff: float = 30.0
+    ) -> None:
+        if attempts < 1:
+            raise ValueError("Attempts must be at least 1.")
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def should_retry(
+        self,
+        method: str,
+        attempt: int,
+        status: int | None = None,
+        connection_error: bool = False,
+    ) -> bool:
+        if attempt >= self.attempts:
+            return False
+        if connection_error:
+            return True
+        if method in IDEMPOTENT_METHODS:
+            return status is None or status in RETRY_STATUSES
+        # A throttled POST was rejected before Keycloak acted on it.
+        return status == 429
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = 10, reset_after: float = 30.0) -> None:
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.opened = 0
+        self.__lock = threading.Lock()
+        self.__failures = 0
+        self.__opened_at: float | None = None
+
+    def check(self) -> None:
+        with self.__lock:
+            if self.__opened_at is None:
+                return
+            remaining = self.__opened_at + self.reset_after - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"Circuit open after {self.__failures} failures, "
+                    f"retrying in {remaining:.0f}s"
+                )
+
+    def success(self) -> None:
+        with self.__lock:
+            self.__failures = 0
+            self.__opened_at = None
+
+    def failure(self) -> None:
+        with self.__lock:
+            self.__failures += 1
+            if self.__failures >= self.threshold:
+                if self.__opened_at is None:
+                    self.opened += 1
+                self.__opened_at = time.monotonic()
@@ -0,0 +1,96 @@
+from itertools import repeat
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ClassVar,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    TypeVar,
+    cast,
+)
+import pandas as pd
+
+MISSING = object()
+T = TypeVar("T", bound="SheetRow")
+
+
+class SheetRow:
+    __slots__ = ()
+    COLUMNS: tuple[str, ...] = ()
+
+    if TYPE_CHECKING:
+        # Provided by the NamedTuple each row class also derives from.
+        _make: ClassVar[Callable[[Iterable[Any]], Any]]
+
+        def __iter__(self) -> Iterator[Any]: ...
+
+    @classmethod
+    def from_frame(cls: type[T], dataframe: pd.DataFrame) -> Iterator[T]:
+        columns = [
+            (
+                dataframe[column].tolist()
+                if column in dataframe.columns
+                else repeat(MISSING, len(dataframe))
+            )
+            for column in cls.COLUMNS
+        ]
+        return map(cls._make, zip(*columns))
+
+    # Rows still answer row["Username"] and row.get(...) like the dicts they replace.
+    def __getitem__(self, key: Any) -> Any:
+        if not isinstance(key, str):
+            return tuple.__getitem__(cast(tuple, self), key)
+        try:
+            value = tuple.__getitem__(cast(tuple, self), self.COLUMNS.index(key))
+        except ValueError:
+            raise KeyError(key) from None
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> dict:
+        return {
+            column: value
+            for column, value in zip(self.COLUMNS, self)
+            if value is not MISSING
+        }
+
+
+class _RoleFields(NamedTuple):
+    role: str
+    description: str
+
+
+class _GroupFields(NamedTuple):
+    name: str
+    description: str
+    roles: list[str]
+
+
+class _UserFields(NamedTuple):
+    username: str
+    name: str
+    groups: list[str]
+
+
+class RoleRow(SheetRow, _RoleFields):
+    __slots__ = ()
+    COLUMNS = ("Role", "Role description")
+
+
+class GroupRow(SheetRow, _GroupFields):
+    __slots__ = ()
+    COLUMNS = ("Name", "Description", "Role")
+
+
+class UserRow(SheetRow, _UserFields):
+    __slots__ = ()
+    COLUMNS = ("Username", "Name", "Group")
@@ -0,0 +1,142 @@
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, cast
+import pandas as pd
+from config import Config
+from journal import LoadJournal
+from keycloak_client import RequestCounts
+from manage_keycloak import KeycloakAdminHandler
+from metrics import Metrics
+from rate_limiter import RequestSlots
+from realm_snapshot import RealmSnapshot
+from rows import UserRow
+from sheet_pipeline import prepare_users
+from token_manager import TokenManager, TokenServer
+
+_host_slots = None
+
+
+def shard_ids(usernames: pd.Series, shards: int) -> pd.Series:
+    # hash_pandas_object uses a fixed key, so a user stays in its shard across runs.
+    hashes = pd.util.hash_pandas_object(usernames.astype(str), index=False)
+    return hashes % shards
+
+
+def partition_users(frames: Iterable[pd.DataFrame], shards: int) -> list[pd.DataFrame]:
+    parts: list[list[pd.DataFrame]] = [[] for _ in range(shards)]
+    for frame in frames:
+        ids = shard_ids(frame["Username"], shards)
+        for shard, part in frame.groupby(ids.to_numpy()):
+            parts[cast(int, shard)].append(part)
+    return [
+        pd.concat(part, ignore_index=True) if part else pd.DataFrame() for part in parts
+    ]
+
+
+@dataclass
+class ShardResult:
+    shard: int
+    rows: int = 0
+    seconds: float = 0.0
+    skipped: int = 0
+    waited: float = 0.0
+    failures: Counter = field(default_factory=Counter)
+    metrics: Metrics = field(default_factory=Metrics)
+    counts: RequestCounts = field(default_factory=RequestCounts)
+    error: str | None = None
+
+    def summary(self) -> str:
+        failed = sum(self.failures.values())
+        outcome = self.error or f"{failed} failed rows"
+        line = f"Shard {self.shard}: {self.rows} rows in {self.seconds:.2f}s, {outcome}"
+        return line + (f", {self.skipped} skipped" if self.skipped else "")
+
+
+def _init_worker(host_slots) -> None:
+    # The per-host semaphore from multi_realm, inherited when the worker starts.
+    global _host_slots
+    _host_slots = host_slots
+
+
+def sync_shard(
+    shard: int,
+    shards: int,
+    users: pd.DataFrame,
+    token_manager: TokenManager,
+    snapshot: RealmSnapshot,
+    resume: bool = False,
+) -> ShardResult:
+    started = time.perf_counter()
+    result = ShardResult(shard)
+    if users.empty:
+        return result
+    config = Config()
+    request_slots = RequestSlots(_host_slots) if _host_slots is not None else None
+    journal_path = config.state_path(f"load-users-{shard}-of-{shards}.jsonl")
+    handler = KeycloakAdminHandler(
+        request_slots,
+        token_manager=token_manager,
+        snapshot=snapshot,
+        rate_limiter=config.create_rate_limiter(share=shards),
+    )
+    try:
+        with LoadJournal(journal_path, resume=resume) as journal:
+            prepared = prepare_users(users)
+            result.rows = len(prepared)
+            handler.manage_users(UserRow.from_frame(prepared), journal=journal)
+            result.skipped = journal.skipped
+    finally:
+        handler.close()
+    result.failures = handler.failures
+    result.metrics = handler.metrics
+    result.counts = handler.request_counts()
+    result.waited = request_slots.waited if request_slots is not None else 0.0
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def sync_users_sharded(
+    keycloak_handler: KeycloakAdminHandler,
+    frames: Iterable[pd.DataFrame],
+    shards: int,
+    resume: bool = False,
+) -> list[ShardResult]:
+    request_slots = keycloak_handler.request_slots
+    host_slots = request_slots.semaphore if request_slots is not None else None
+    with keycloak_handler.metrics.phase("users"):
+        snapshot = keycloak_handler.user_snapshot()
+        parts = partition_users(frames, shards)
+        context = multiprocessing.get_context("spawn")
+        with TokenServer(ctx=context) as server:
+            token_manager = Config().create_token_manager(server=server)
+            with ProcessPoolExecutor(
+                max_workers=shards,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(host_slots,),
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        sync_shard, shard, shards, part, token_manager, snapshot, resume
+                    )
+                    for shard, part in enumerate(parts)
+                ]
+                results = []
+                for shard, future in enumerate(futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {str(e)}"
+                        results.append(ShardResult(shard, error=error))
+    for result in results:
+        keycloak_handler.metrics.merge(result.metrics)
+        keycloak_handler.failures.update(result.failures)
+        keycloak_handler.add_request_counts(result.counts)
+        if request_slots is not None:
+            request_slots.waited += result.waited
+        if result.error is not None:
+            keycloak_handler.failures["users shard"] += 1
+    return results
@@ -0,0 +1,61 @@
+import logging
+import pandas as pd
+
+
+def _explode_names(dataframe: pd.DataFrame, column: str) -> pd.DataFrame:
+    names = dataframe[column].astype("string")
+    if not names.str.contains("\n", regex=False).any():
+        names = names.str.strip()
+        return dataframe.assign(**{column: names})[names.notna() & (names != "")]
+    names = names.str.split("\n")
+    exploded = dataframe.assign(**{column: names}).explode(column)
+    exploded[column] = exploded[column].str.strip()
+    return exploded[exploded[column].notna() & (exploded[column] != "")]
+
+
+def _collect(keys: pd.Series, values: pd.Series) -> pd.Series:
+    # One pass over the columns; groupby().agg(list) calls back into Python once
+    # per group, which is much slower with one group per user. See bench_pipeline.
+    collected: dict = {}
+    for key, value in zip(keys.tolist(), values.tolist()):
+        collected.setdefault(key, []).append(value)
+    return pd.Series(collected, dtype=object)
+
+
+def prepare_roles(roles: pd.DataFrame) -> pd.DataFrame:
+    return roles.drop_duplicates(subset="Role", keep="last")
+
+
+def prepare_groups(groups: pd.DataFrame, roles: pd.DataFrame) -> pd.DataFrame:
+    exploded = _explode_names(groups, "Role").drop_duplicates(subset=["Name", "Role"])
+    # Roles missing from the sheet stay in the row: the sync fails the group when
+    # the realm does not have them either, instead of creating it without them.
+    unknown = exploded[~exploded["Role"].isin(roles["Role"])]
+    for name, names in unknown.groupby("Name", sort=False)["Role"]:
+        logging.getLogger(__name__).warning(
+            f"Group '{name}' - roles not in the Roles sheet: {', '.join(names)}"
+        )
+    grouped = exploded.groupby("Name", sort=False).agg(
+        Description=("Description", "first"), Role=("Role", list)
+    )
+    descriptions = groups.drop_duplicates(subset="Name").set_index("Name")[
+        "Description"
+    ]
+    result = descriptions.to_frame().join(grouped["Role"], how="left")
+    result["Role"] = [
+        roles if isinstance(roles, list) else [] for roles in result["Role"]
+    ]
+    return result.reset_index()
+
+
+def prepare_users(users: pd.DataFrame) -> pd.DataFrame:
+    exploded = _explode_names(users, "Group").drop_duplicates(
+        subset=["Username", "Group"]
+    )
+    grouped = _collect(exploded["Username"], exploded["Group"]).rename("Group")
+    names = users.drop_duplicates(subset="Username").set_index("Username")["Name"]
+    result = names.to_frame().join(grouped, how="left")
+    result["Group"] = [
+        groups if isinstance(groups, list) else [] for groups in result["Group"]
+    ]
+    return result.reset_index()
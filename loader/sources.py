@@ -0,0 +1,139 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Iterator
+import pandas as pd
+
+
+class RowSource(ABC):
+    def __init__(self, path: str, ffill: bool = True) -> None:
+        if not path:
+            raise ValueError("File path cannot be empty.")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"The file at path '{path}' was not found.")
+        self.path = path
+        self.ffill = ffill
+
+    @abstractmethod
+    def _read_chunks(
+        self, fields: list[str] | None, chunk_size: int
+    ) -> Iterator[pd.DataFrame]: ...
+
+    def iter_chunks(
+        self, *fields: str, chunk_size: int = 10000
+    ) -> Iterator[pd.DataFrame]:
+        previous = None
+        for chunk in self._read_chunks(list(fields) or None, chunk_size):
+            if fields:
+                missing = [field for field in fields if field not in chunk.columns]
+                if missing:
+                    raise KeyError(
+                        f"The following fields are missing from the source: {missing}"
+                    )
+                chunk = chunk[list(fields)]
+            if self.ffill:
+                chunk = chunk.ffill(axis=0)
+                if previous is not None:
+                    chunk = chunk.fillna(previous)
+                previous = chunk.iloc[-1]
+            yield chunk
+
+    def iter_rows(self, *fields: str, chunk_size: int = 10000) -> Iterator[dict]:
+        for chunk in self.iter_chunks(*fields, chunk_size=chunk_size):
+            yield from chunk.to_dict(orient="records")
+
+    def read_all(self) -> pd.DataFrame:
+        chunks = list(self.iter_chunks())
+        if not chunks:
+            return pd.DataFrame()
+        return pd.concat(chunks, ignore_index=True)
+
+
+class ExcelSource(RowSource):
+    def __init__(self, path: str, sheet: str, ffill: bool = True) -> None:
+        super().__init__(path, ffill)
+        self.sheet = sheet
+
+    def _read_chunks(
+        self, fields: list[str] | None, chunk_size: int
+    ) -> Iterator[pd.DataFrame]:
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            if self.sheet not in workbook.sheetnames:
+                raise ValueError(f"Worksheet named '{self.sheet}' not found")
+            rows = workbook[self.sheet].iter_rows(values_only=True)
+            header = [None if cell is None else str(cell) for cell in next(rows, ())]
+            fields = fields or [column for column in header if column is not None]
+            missing = [field for field in fields if field not in header]
+            if missing:
+                raise KeyError(
+                    f"The following fields are missing from the source: {missing}"
+                )
+            indices = [header.index(field) for field in fields]
+            batch = []
+            for row in rows:
+                values = [row[index] if index < len(row) else None for index in indices]
+                if all(value is None for value in values):
+                    continue
+                batch.append(values)
+                if len(batch) == chunk_size:
+                    yield pd.DataFrame(batch, columns=fields)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=fields)
+        finally:
+            workbook.close()
+
+
+class CsvSource(RowSource):
+    def _read_chunks(
+        self, fields: list[str] | None, chunk_size: int
+    ) -> Iterator[pd.DataFrame]:
+        with pd.read_csv(
+            self.path,
+            usecols=(lambda column: column in fields) if fields else None,
+            chunksize=chunk_size,
+        ) as reader:
+            yield from reader
+
+
+class JsonLinesSource(RowSource):
+    def _read_chunks(
+        self, fields: list[str] | None, chunk_size: int
+    ) -> Iterator[pd.DataFrame]:
+        with pd.read_json(self.path, lines=True, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                if fields:
+                    chunk = chunk[[field for field in fields if field in chunk.columns]]
+                yield chunk
+
+
+class ParquetSource(RowSource):
+    def _read_chunks(
+        self, fields: list[str] | None, chunk_size: int
+    ) -> Iterator[pd.DataFrame]:
+        try:
+            import pyarrow.parquet as pq  # type: ignore[import]
+        except ImportError:
+            raise ImportError("Reading Parquet sources requires the pyarrow package.")
+        parquet_file = pq.ParquetFile(self.path)
+        available = set(parquet_file.schema_arrow.names)
+        columns = [field for field in fields if field in available] if fields else None
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+
+
+def open_source(path: str, sheet: str | None = None, ffill: bool = True) -> RowSource:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        if not sheet:
+            raise ValueError(f"A sheet name is required to read '{path}'.")
+        return ExcelSource(path, sheet, ffill)
+    if extension == ".csv":
+        return CsvSource(path, ffill)
+    if extension in (".jsonl", ".ndjson"):
+        return JsonLinesSource(path, ffill)
+    if extension == ".parquet":
+        return ParquetSource(path, ffill)
+    raise ValueError(f"Unsupported source file type: '{extension}'")
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Iterable
+from async_keycloak_client import AsyncKeycloakClient
+from payloads import group_payload, role_payload, split_names, user_payload
+from journal import LoadJournal
+from logging_setup import log_context
+from metrics import timed_phase
+from realm_snapshot import RealmSnapshot
+from rows import SheetRow
+
+
+class AsyncSyncEngine:
+
+    def __init__(
+        self,
+        client: AsyncKeycloakClient,
+        concurrency: int = 10,
+        snapshot: RealmSnapshot | None = None,
+        journal: LoadJournal | None = None,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+        self.__client = client
+        self.__concurrency = concurrency
+        self.__realm_endpoint = f"/admin/realms/{client.realm}"
+        self.snapshot = snapshot if snapshot is not None else RealmSnapshot()
+        self.journal = journal
+        self.failures: Counter[str] = Counter()
+        self.metrics = client.metrics
+        self.__logger = logging.getLogger(__name__)
+
+    async def run(
+        self,
+        roles: Iterable[dict | SheetRow] | None = None,
+        groups: Iterable[dict | SheetRow] | None = None,
+        users: Iterable[dict | SheetRow] | None = None,
+    ) -> None:
+        if roles is not None:
+            await self.sync_roles(roles)
+        if groups is not None:
+            await self.sync_groups(groups)
+        if users is not None:
+            await self.sync_users(users)
+
+    @timed_phase("roles")
+    async def sync_roles(
+        self,
+        roles: Iterable[dict | SheetRow],
+        name_key: str = "Role",
+        desc_key: str | None = "Role description",
+    ) -> None:
+        roles_endpoint = f"{self.__realm_endpoint}/roles"
+        await self.__ensure_roles()
+
+        async def process(role: dict | SheetRow) -> None:
+            data = role_payload(role[name_key], role.get(desc_key, ""))
+            if self.snapshot.role(data["name"]) is not None:
+                result = await self.__client.put(
+                    f"{roles_endpoint}/{data['name']}", data
+                )
+                result.raise_for_error()
+                return
+            result = await self.__client.post(roles_endpoint, data)
+            if not result.conflict:
+                result.raise_for_error()
+            self.snapshot.add_role(data)
+
+        await self.__run_bounded(roles, process, "Sync roles", "roles", name_key)
+
+    @timed_phase("groups")
+    async def sync_groups(self, groups: Iterable[dict | SheetRow]) -> None:
+        groups_endpoint = f"{self.__realm_endpoint}/groups"
+        await self.__ensure_roles()
+        await self.__ensure_groups()
+
+        async def process(group_data: dict | SheetRow) -> None:
+            data = group_payload(group_data["Name"], group_data["Description"])
+            group_id = self.snapshot.group_id(data["name"])
+            if group_id:
+                result = await self.__client.put(f"{groups_endpoint}/{group_id}", data)
+                result.raise_for_error()
+            else:
+                response = await self.__client.post(groups_endpoint, data)
+                group_id = await self.__created_id(
+                    response, groups_endpoint, data["name"], "name"
+                )
+                if not group_id:
+                    raise ValueError(f"Group '{data['name']}' was not created")
+                self.snapshot.add_group(data["name"], group_id)
+            await self.__assign_roles(group_id, group_data.get("Role", ""))
+
+        await self.__run_bounded(groups, process, "Sync groups", "groups", "Name")
+
+    @timed_phase("users")
+    async def sync_users(self, users: Iterable[dict | SheetRow]) -> None:
+        users_endpoint = f"{self.__realm_endpoint}/users"
+        await self.__ensure_groups()
+        await self.__ensure_users()
+        await self.__ensure_memberships()
+
+        async def process(user_data: dict | SheetRow) -> None:
+            data = user_payload(user_data["Username"], user_data["Name"])
+            user_id = self.snapshot.user_id(data["username"])
+            if user_id:
+                result = await self.__client.put(f"{users_endpoint}/{user_id}", data)
+                result.raise_for_error()
+            else:
+                response = await self.__client.post(users_endpoint, data)
+                user_id = await self.__created_id(
+                    response, users_endpoint, data["username"], "username"
+                )
+                if not user_id:
+                    raise ValueError(f"User '{data['username']}' was not created")
+                self.snapshot.add_user(data["username"], user_id)
+            await self.__assign_groups(user_id, user_data.get("Group", ""))
+
+        await self.__run_bounded(users, process, "Sync users", "users", "Username")
+
+    async def __assign_roles(self, group_id: str, role_names) -> None:
+        if group_id not in self.snapshot.group_roles:
+            assigned = await self.__get_list(
+                f"{self.__realm_endpoint}/groups/{group_id}/role-mappings/realm"
+            )
+            self.snapshot.set_group_roles(group_id, [role["name"] for role in assigned])
+        assigned_names = self.snapshot.group_roles[group_id]
+        missing, unknown = [], []
+        for role_name in dict.fromkeys(split_names(role_names)):
+            if role_name in assigned_names:
+                continue
+            role = await self.__get_role(role_name)
+            if role is None:
+                unknown.append(role_name)
+                continue
+            missing.append({"id": role["id"], "name": role["name"]})
+        if missing:
+            assign_endpoint = (
+                f"{self.__realm_endpoint}/groups/{group_id}/role-mappings/realm"
+            )
+            result = await self.__client.post(assign_endpoint, missing)
+            if result.raise_for_error():
+                self.snapshot.assign_group_roles(
+                    group_id, [role["name"] for role in missing]
+                )
+        # Fail the row so it is not journaled and --resume retries the mapping.
+        if unknown:
+            raise ValueError(f"unknown roles: {', '.join(unknown)}")
+
+    async def __assign_groups(self, user_id: str, group_names) -> None:
+        if user_id not in self.snapshot.user_groups:
+            assigned = await self.__get_list(
+                f"{self.__realm_endpoint}/users/{user_id}/groups"
+            )
+            self.snapshot.set_user_groups(
+                user_id, [group["name"] for group in assigned]
+            )
+        assigned_names = self.snapshot.user_groups[user_id]
+        unknown = []
+        for group_name in dict.fromkeys(split_names(group_names)):
+            if group_name in assigned_names:
+                continue
+            group_id = self.snapshot.group_id(group_name)
+            if group_id is None:
+                unknown.append(group_name)
+                continue
+            response = await self.__client.put(
+                f"{self.__realm_endpoint}/users/{user_id}/groups/{group_id}"
+            )
+            if response.raise_for_error():
+                self.snapshot.assign_user_groups(user_id, [group_name])
+        if unknown:
+            raise ValueError(f"unknown groups: {', '.join(unknown)}")
+
+    async def __get_role(self, role_name: str) -> dict | None:
+        role = self.snapshot.role(role_name)
+        if role is not None and "id" not in role:
+            result = await self.__client.get(
+                f"{self.__realm_endpoint}/roles/{role_name}"
+            )
+            role = result.raise_for_error().data
+            if role is not None:
+                self.snapshot.add_role(role)
+        return role
+
+    async def __ensure_roles(self) -> None:
+        if self.snapshot.roles is None:
+            self.snapshot.load_roles([])
+            endpoint = f"{self.__realm_endpoint}/roles"
+            async for role in self.__client.paginate(endpoint):
+                self.snapshot.add_role(role)
+
+    async def __ensure_groups(self) -> None:
+        if self.snapshot.groups is None:
+            self.snapshot.load_groups([])
+            endpoint = f"{self.__realm_endpoint}/groups"
+            async for group in self.__client.paginate(endpoint):
+                self.snapshot.add_group(group["name"], group["id"], new=False)
+
+    async def __ensure_users(self) -> None:
+        if self.snapshot.users is None:
+            self.snapshot.load_users([])
+            endpoint = f"{self.__realm_endpoint}/users"
+            async for user in self.__client.paginate(endpoint):
+                self.snapshot.add_user(user["username"], user["id"], new=False)
+
+    async def __ensure_memberships(self) -> None:
+        snapshot = self.snapshot
+        # Listing members costs a request per group instead of one per user.
+        if snapshot.memberships_loaded or len(snapshot.users or {}) <= len(
+            snapshot.groups or {}
+        ):
+            return
+        members = []
+
+        async def collect(group: tuple[str, str]) -> None:
+            group_name, group_id = group
+            endpoint = f"{self.__realm_endpoint}/groups/{group_id}/members"
+            async for member in self.__client.paginate(endpoint):
+                members.append((member["id"], group_name))
+
+        await self.__run_bounded(
+            list((snapshot.groups or {}).items()), collect, "Load memberships"
+        )
+        snapshot.load_memberships(members)
+
+    async def __created_id(
+        self, response, endpoint: str, name: str, key: str
+    ) -> str | None:
+        location = None if response.conflict else response.raise_for_error().location
+        if location:
+            return location.rstrip("/").rsplit("/", 1)[-1]
+        params = {"exact": "true", key if key != "name" else "search": name}
+        for item in await self.__get_list(endpoint, params):
+            if item.get(key) == name:
+                return item["id"]
+        return None
+
+    async def __get_list(self, endpoint: str, params: dict | None = None) -> list:
+        result = await self.__client.get(endpoint, params=params)
+        data = result.raise_for_error().data
+        return data if isinstance(data, list) else []
+
+    async def __run_bounded(
+        self,
+        items: Iterable,
+        worker: Callable[[Any], Awaitable[None]],
+        phase: str,
+        journal_phase: str | None = None,
+        name_key: str | None = None,
+    ) -> None:
+        journal = self.journal if journal_phase else None
+        key = journal_phase or phase
+        if journal is not None:
+            items = journal.pending(key, items)
+        iterator = iter(items)
+
+        async def consume() -> None:
+            for item in iterator:
+                name = item.get(name_key) if name_key else None
+                with log_context(phase=self.metrics.current_phase, object=name):
+                    try:
+                        await worker(item)
+                        if journal is not None:
+                            journal.record(key, item)
+                    except KeyError as e:
+                        self.__failed(key, f"{phase} - missing key in data: {str(e)}")
+                    except ValueError as e:
+                        self.__failed(key, f"{phase} - data format error: {str(e)}")
+                    except Exception as e:
+                        self.__failed(key, f"{phase}: {str(e)}")
+
+        await asyncio.gather(*(consume() for _ in range(self.__concurrency)))
+
+    def __failed(self, phase: str, message: str) -> None:
+        self.failures[phase] += 1
+        self.__logger.error(message)
+
+    def failure_summary(self) -> str:
+        rows = ", ".join(f"{phase}: {count}" for phase, count in self.failures.items())
+        summary = self.__client.failure_summary()
+        return f"Failed rows - {rows}\n{summary}" if rows else summary
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import threading
+import time
+import requests
+from multiprocessing.managers import BaseManager
+from typing import Callable
+
+GRANT_TYPES = ("password", "client_credentials")
+
+
+class TokenManager:
+
+    def __init__(
+        self,
+        host: str,
+        realm: str = "master",
+        client_id: str = "admin-cli",
+        client_secret: str | None = None,
+        username: str | None = None,
+        password: str | None = None,
+        grant_type: str = "password",
+        leeway: float = 30.0,
+        session: requests.Session | None = None,
+        timeout: tuple[float, float] = (5, 30),
+    ) -> None:
+        if grant_type not in GRANT_TYPES:
+            raise ValueError(f"Grant type must be one of {GRANT_TYPES}")
+        self.token_endpoint = f"{host}/realms/{realm}/protocol/openid-connect/token"
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.username = username
+        self.password = password
+        self.grant_type = grant_type
+        self.leeway = leeway
+        self.session = session if session is not None else requests.Session()
+        self.timeout = timeout
+        self.grants = 0
+        self.refreshes = 0
+        self.__lock = threading.Lock()
+        # Type and value are replaced together, so a reader never mixes two tokens.
+        self.__token: tuple[str, str] | None = None
+        self.__refresh_token: str | None = None
+        self.__refresh_at = 0.0
+        self.__refresh_expires_at = 0.0
+        self.__logger = logging.getLogger(__name__)
+
+    def token(self) -> tuple[str, str]:
+        with self.__lock:
+            if self.__token is not None and self.__fresh():
+                return self.__token
+            return self.__fetch()
+
+    def authorization(self) -> str:
+        token_type, access_token = self.token()
+        return f"{token_type} {access_token}"
+
+    async def authorization_async(self) -> str:
+        # Waiting for the lock would block the event loop during a refresh.
+        token = self.__token
+        if token is not None and self.__fresh():
+            return f"{token[0]} {token[1]}"
+        return await asyncio.to_thread(self.authorization)
+
+    def invalidate(self, authorization: str) -> None:
+        with self.__lock:
+            if self.__token and authorization == " ".join(self.__token):
+                self.__refresh_at = 0.0
+
+    def __fresh(self) -> bool:
+        return self.__token is not None and time.monotonic() < self.__refresh_at
+
+    def __fetch(self) -> tuple[str, str]:
+        if self.__refresh_token and time.monotonic() < self.__refresh_expires_at:
+            data = {
+                "grant_type": "refresh_token",
+                "refresh_token": self.__refresh_token,
+                **self.__client_data(),
+            }
+            try:
+                token = self.__store(self.__post(data))
+                self.refreshes += 1
+                return token
+            except requests.HTTPError as e:
+                self.__logger.warning(f"Token refresh failed, new grant: {str(e)}")
+        data = {"grant_type": self.grant_type, **self.__client_data()}
+        if self.grant_type == "password":
+            data.update(username=self.username, password=self.password)
+        token = self.__store(self.__post(data))
+        self.grants += 1
+        return token
+
+    def __client_data(self) -> dict:
+        data = {"client_id": self.client_id}
+        if self.client_secret:
+            data["client_secret"] = self.client_secret
+        return data
+
+    def __post(self, data: dict) -> dict:
+        response = self.session.post(
+            self.token_endpoint, data=data, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def __store(self, data: dict) -> tuple[str, str]:
+        now = time.monotonic()
+        expires_in = float(data.get("expires_in", 60))
+        # Short-lived tokens are refreshed halfway through rather than never.
+        lifetime = max(expires_in - self.leeway, expires_in / 2)
+        self.__token = (data["token_type"], data["access_token"])
+        self.__refresh_token = data.get("refresh_token")
+        self.__refresh_at = now + lifetime
+        self.__refresh_expires_at = now + float(data.get("refresh_expires_in", 0))
+        self.__logger.info(f"Access token valid for {expires_in:.0f}s")
+        return self.__token
+
+
+class TokenServer(BaseManager):
+    # Set by register() below; returns a proxy to a TokenManager in the server.
+    TokenManager: Callable[..., TokenManager]
+
+
+# Worker processes share one token through a proxy to the server process.
+TokenServer.register(
+    "TokenManager", TokenManager, exposed=("token", "authorization", "invalidate")
+)